@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Render benchmark: drives both displays with synthetic output state on the
+headless framebuffer backend and reports frames per second and per-frame time
+percentiles. Runs on any machine, run it from the repository root (for the
+fonts), e.g.:
+
+    python -m cineface.bench --frames 2000
+
+With --fader the motor fader control loop runs on a simulated fader at the
+same time, following the swept volume, and its timing is reported as well:
+
+    python -m cineface.bench --frames 2000 --fader 500
+"""
+import argparse
+import math
+import time
+
+import toml
+
+from cineface.config import Config, EXAMPLE_CONFIG
+from cineface.curve import db_to_fader
+from cineface.display import VolumeDisplay, LevelDisplay
+from cineface.fader import MotorFader, SimulatedFader
+from cineface.latency import percentile
+from cineface.meters import MeterBallistics
+from cineface.state import OutputState
+
+
+
+
+def bench_config(png_dir=None) -> Config:
+    """
+    The example configuration with both displays on the framebuffer backend
+    """
+    config = Config(toml.loads(EXAMPLE_CONFIG))
+    for section in ("VolumeDisplay", "LevelDisplay"):
+        config[section]["active"] = True
+        config[section]["backend"] = "framebuffer"
+        if png_dir is not None:
+            config[section]["png_dir"] = png_dir
+    return config
+
+
+def synthetic_levels(config, meters, t):
+    """
+    Return a snapshot of the configured outputs at time t (in seconds) with
+    levels moving like program material
+    """
+    # Set the levels of all outputs, then advance the ballistics once
+    firsts = []
+    channel = 0
+    for i, output in enumerate(config["Output"]):
+        sides = ("L", "R") if output["stereo"] else (None,)
+        for side in sides:
+            level = 0.45 + 0.35 * math.sin(t * (3.0 + channel)) * math.sin(t * 0.7 + i)
+            meters.set(channel + (side == "R"), max(0.0, level))
+        firsts.append(channel)
+        channel += len(sides)
+    meters.step(t)
+
+    snapshot = []
+    for i, (output, first) in enumerate(zip(config["Output"], firsts)):
+        if output["stereo"]:
+            levels = {"L": meters.value[first], "R": meters.value[first + 1]}
+            peaks = {"L": meters.peak[first], "R": meters.peak[first + 1]}
+        else:
+            levels = meters.value[first]
+            peaks = meters.peak[first]
+
+        # Mute one output every few seconds
+        mute = int(t / 3.0) % len(config["Output"]) == i
+        snapshot.append(OutputState(output["name"], output["short"], output["stereo"], 0.8, mute, levels, peaks))
+    return tuple(snapshot)
+
+
+def report(name, times, extra=""):
+    times = sorted(times)
+    total = sum(times)
+    fps = len(times) / total if total > 0 else float("inf")
+    print("{:>14}: {:8.1f} fps | p50 {:6.2f} ms | p90 {:6.2f} ms | p99 {:6.2f} ms | max {:6.2f} ms {}".format(
+        name,
+        fps,
+        percentile(times, 50) * 1000,
+        percentile(times, 90) * 1000,
+        percentile(times, 99) * 1000,
+        times[-1] * 1000,
+        extra))
+
+
+def run(frames=1000, frame_time=1/30, png_dir=None, fader_rate=None):
+    config = bench_config(png_dir)
+
+    fader = None
+    if fader_rate:
+        fader = MotorFader(SimulatedFader(), rate=fader_rate).start()
+
+    volume_display = VolumeDisplay().from_config(config)
+    level_display = LevelDisplay().from_config(config)
+
+    meters = MeterBallistics().from_config(config)
+    for output in config["Output"]:
+        for _ in range(2 if output["stereo"] else 1):
+            meters.add_channel()
+
+    volume_times = []
+    level_times = []
+    for frame in range(frames):
+        t = frame * frame_time
+
+        # Sweep the volume up and down through the whole range in 0.1 dB steps
+        db = -65.0 + abs((frame % 1420) - 710) / 10.0
+        if fader is not None:
+            fader.set_volume(db_to_fader(db))
+        start = time.perf_counter()
+        volume_display.render((db, frame % 200 < 100))
+        volume_times.append(time.perf_counter() - start)
+
+        snapshot = synthetic_levels(config, meters, t)
+        start = time.perf_counter()
+        level_display.render(snapshot)
+        level_times.append(time.perf_counter() - start)
+
+    print("Rendered {} frames per display".format(frames))
+    report("VolumeDisplay", volume_times, "({})".format(volume_display.cache.stats()))
+    report("LevelDisplay", level_times)
+
+    if fader is not None:
+        fader.stop()
+        print("{:>14}: {}".format("MotorFader", fader.stats()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cineface display rendering")
+    parser.add_argument("--frames", type=int, default=1000, help="number of frames to render per display")
+    parser.add_argument("--png-dir", default=None, help="save every frame as PNG into this directory")
+    parser.add_argument("--fader", type=float, default=None, metavar="RATE", help="run the motor fader loop on a simulated fader at RATE Hz")
+    args = parser.parse_args()
+    run(frames=args.frames, png_dir=args.png_dir, fader_rate=args.fader)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+import traceback
+from time import perf_counter
+
+from cineface.latency import Histogram, format_seconds
+
+
+
+
+class EventBridge():
+    """
+    Hands events from other threads (e.g. gpiozero's callback thread) to the
+    asyncio event loop, so their handlers run on the loop thread like the
+    handlers of incoming OSC messages: the state, the LEDs and the client
+    socket are then only ever touched from one thread.
+
+    post() takes a timestamp right away (as close to the edge as gpiozero
+    lets us) and schedules the handler with call_soon_threadsafe. At most
+    maxsize events can be waiting, more are dropped and counted (a bouncing
+    contact must not be able to flood the loop).
+
+    Handlers send their commands synchronously, so the time from the edge to
+    the handler returning is the button-to-datagram latency. It is recorded
+    in the latency Histogram, see stats()
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.loop    = None
+
+        self.lock    = threading.Lock()
+        self.pending = 0
+
+        # Events handled and dropped because too many were waiting
+        self.handled = 0
+        self.dropped = 0
+
+        # From the edge to the handler being called, and to it being done
+        self.wait    = Histogram()
+        self.latency = Histogram()
+
+    def attach(self, loop):
+        """
+        Run the handlers on the given event loop from now on
+        """
+        with self.lock:
+            self.loop = loop
+
+    def detach(self):
+        """
+        Drop all further events (e.g. before the event loop is closed)
+        """
+        with self.lock:
+            self.loop = None
+
+    def post(self, handler, *args):
+        """
+        Call handler(*args) on the event loop (can be called from any thread)
+        """
+        edge = perf_counter()
+        with self.lock:
+            # Without a (running) loop nothing could handle the event
+            if self.loop is None or self.pending >= self.maxsize:
+                self.dropped += 1
+                return
+            try:
+                self.loop.call_soon_threadsafe(self.dispatch, edge, handler, args)
+            except RuntimeError:
+                # The loop was closed
+                self.dropped += 1
+                return
+            self.pending += 1
+
+    def dispatch(self, edge, handler, args):
+        with self.lock:
+            self.pending -= 1
+
+        start = perf_counter()
+        self.wait.record(start - edge)
+        try:
+            handler(*args)
+        except Exception:
+            print("Error: handling {} failed:".format(handler), file=sys.stderr)
+            traceback.print_exc()
+        self.latency.record(perf_counter() - edge)
+        self.handled += 1
+
+    def stats(self) -> str:
+        return "{} events handled, {} dropped, edge to datagram p50 {} p99 {} max {} (waiting for the loop p99 {})".format(
+            self.handled,
+            self.dropped,
+            format_seconds(self.latency.percentile(50)),
+            format_seconds(self.latency.percentile(99)),
+            format_seconds(self.latency.max),
+            format_seconds(self.wait.percentile(99)))
@@ -4,14 +4,35 @@ import toml
 from typing import NewType, Optional, Tuple, Iterable, List
 from collections.abc import MutableMapping
 import os, sys
-import importlib_metadata
+from functools import lru_cache
 
 import appdirs
 
-VERSION = importlib_metadata.metadata(__package__)["Version"]
-APPLICATION_NAME = importlib_metadata.metadata(__package__)["Name"]
-LICENSE = importlib_metadata.metadata(__package__)["License"]
-AUTHOR = importlib_metadata.metadata(__package__)["Author"]
+# Module attributes that are read from the package metadata on first access
+METADATA_FIELDS = {
+    "VERSION": "Version",
+    "APPLICATION_NAME": "Name",
+    "LICENSE": "License",
+    "AUTHOR": "Author",
+}
+
+
+@lru_cache(maxsize=None)
+def package_metadata() -> dict:
+    """
+    Read the metadata of the installed package (once, it is slow). Fields
+    that are missing from the metadata (e.g. License, depending on how the
+    package was built) are None
+    """
+    import importlib_metadata
+    metadata = importlib_metadata.metadata(__package__)
+    return {name: metadata.get(field) for name, field in METADATA_FIELDS.items()}
+
+
+def __getattr__(name):
+    if name in METADATA_FIELDS:
+        return package_metadata()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 EXAMPLE_CONFIG = """# ======= CINEFACE CONFIGURATION FILE =======
@@ -22,29 +43,52 @@ EXAMPLE_CONFIG = """# ======= CINEFACE CONFIGURATION FILE =======
 ip = "192.168.178.81"
 port = 7001
 
+# Continuous volume changes are sent at most this many times per second
+# (optional, defaults to 50)
+# max_rate = 50
+
 
 
 [Server]
 # Address/Port for the OSC Server
 ip = "0.0.0.0"
 port = 9001
+# Seconds without any message from TotalMix before it is asked for its state,
+# outputs are marked stale if it doesn't answer (optional, defaults to 2.0)
+# watchdog_timeout = 2.0
 
 
 
 [VolumeDisplay]
 active = true
 
+# Use backend = "framebuffer" to render into memory instead of a real display
+# (optional, png_dir = "some/dir" also saves every frame as a PNG)
+# backend = "sh1106"
+
 # Find this address using i2cdetect -y 1
 i2c_address = "0x3C"
 i2c_port = 1
 font = "fonts/Inter-Thin.ttf"
 size = 50
 
+# Maximum frames per second (optional, defaults to 10)
+# max_fps = 10
+
+# Number of rendered frames to keep in memory (optional, defaults to 256).
+# 1424 frames cover every possible value, turning on warm_up_cache renders
+# them on startup (at the cost of a slower start)
+# cache_size = 256
+# warm_up_cache = false
+
 
 
 [LevelDisplay]
 active = true
 
+# See [VolumeDisplay]
+# backend = "sh1106"
+
 # Find this address using i2cdetect -y 1
 i2c_address = "0x3D"
 i2c_port = 1
@@ -56,12 +100,55 @@ right = ["headphones"]
 # Supply a list of floats here, if the list = [] don't draw horizontal bars
 db_markers = [0.0, -6.0, -12.0, -18.0, -24.0, -32.0, -38.0, -44.0]
 
+# Maximum frames per second (optional, defaults to 30)
+# max_fps = 30
+
+# Meter ballistics in seconds (optional): time constants for rising and
+# falling meters and how long the peak marker stays up (0 turns it off)
+# attack = 0.0
+# release = 0.3
+# peak_hold = 1.0
+
+
+
+# Optional volume fader: a MCP3001 ADC reads the position, an L293D drives
+# the motor so it follows the volume (use backend = "simulated" to try it)
+# [Fader]
+# active = true
+# backend = "l293d"
+# Set motor = false for a plain potentiometer
+# motor = true
+# motor_forward = 5
+# motor_backward = 6
+# motor_enable = 12
+# Filtering of the position: "median" or "ema" over the last samples (ema
+# with the factor alpha), a change has to exceed deadband (hysteresis once
+# the knob moves, both in fractions of the travel) and min_db to be sent
+# filter = "median"
+# samples = 9
+# alpha = 0.2
+# deadband = 0.004
+# hysteresis = 0.002
+# min_db = 0.2
+# Sampling rate in Hz without a motor, with a motor the control loop samples
+# sample_rate = 200
+# Control loop rate in Hz and PID gains
+# rate = 500
+# kp = 12.0
+# ki = 4.0
+# kd = 0.15
+# dB values printed along the travel as [dB, position] pairs (defaults to the
+# TotalMix fader curve)
+# scale = [[-65.0, 0.0], [0.0, 0.817], [6.0, 1.0]]
+
 
 
 # You can add more outputs or leave some out if you like by 
 # adding/removing [[Output]] blocks
 # short is used in the levels display so it must be <5 chars for stereo channels
 # and <3 chars for mono channels
+# Outputs with independent_volume = true (optional, defaults to true for outputs
+# named "headphones") don't count towards the uniform volume warning
 
 [[Output]]
 name = "headphones"
@@ -156,7 +243,7 @@ class Config(MutableMapping):
         """
         Check the Configuration for missing fields
         """
-        example_config = toml.loads(EXAMPLE_CONFIG)
+        example_config = example_schema()
         ok = True
         for s in example_config.keys():
             if not s in self.keys():
@@ -169,12 +256,23 @@ class Config(MutableMapping):
                             print("Error: Your configuration misses the field \"{}\" in the section: [{}]".format(v, s), file=sys.stderr)
                             ok = False
                 elif type(example_config[s]) == list:
+                    if not self[s]:
+                        print("Error: Your configuration needs at least one [[{}]] section".format(s), file=sys.stderr)
+                        ok = False
+                        continue
                     for listelement in example_config[s]:
                         for v in listelement.keys():
                             if not v in self[s][0].keys():
                                 print("Error: Your configuration misses the field \"{}\" in the section: [{}]".format(v, s), file=sys.stderr)
                                 ok = False
 
+        # Settings that are divided by or used as sizes must be positive
+        for s, v, types in (("VolumeDisplay", "max_fps", (int, float)), ("VolumeDisplay", "cache_size", int), ("LevelDisplay", "max_fps", (int, float))):
+            value = self.get(s, {}).get(v)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, types) or value <= 0):
+                print("Error: \"{}\" in the section [{}] must be a positive number, not {}".format(v, s, value), file=sys.stderr)
+                ok = False
+
         if not ok:
             print("Hint: You can delete your configuration and cineface will write a new default one")
 
@@ -182,6 +280,33 @@ class Config(MutableMapping):
 
 
 
+@lru_cache(maxsize=None)
+def example_schema() -> dict:
+    """
+    The parsed EXAMPLE_CONFIG, which every config is checked against. Parsed
+    once, don't modify the result
+    """
+    return toml.loads(EXAMPLE_CONFIG)
+
+
+def load_config(path: str) -> Optional[Config]:
+    """
+    Read and check the config at path without exiting on errors (e.g. when it
+    is reloaded while running). Returns None if it can't be used
+    """
+    try:
+        with open(path, encoding='utf-8') as c:
+            config = Config(toml.loads(c.read()))
+    except (OSError, toml.TomlDecodeError) as e:
+        print("Error: Couldn't read the configuration file at \"{}\":".format(path), file=sys.stderr)
+        print(e, file=sys.stderr)
+        return None
+
+    if not config.is_good():
+        return None
+    return config
+
+
 def init_config() -> Optional[Config]:
     """
     Read the config from the user config path. 
@@ -210,7 +335,7 @@ def new_config(user_config_path: str, skip_prompt: bool=True):
     """
     # Create all directories in the path to the config, if they don't exist yet
     try:
-        os.makedirs(user_config_path.rstrip("{}.toml".format(APPLICATION_NAME)))
+        os.makedirs(user_config_path.rstrip("{}.toml".format(__package__)))
     except FileExistsError:
         pass
 
@@ -232,6 +357,8 @@ def get_user_config_path() -> str:
     """
     Return the user config path
     """
-    user_config_path = appdirs.user_config_dir(APPLICATION_NAME)
+    # The package is named like the application, reading the name from the
+    # metadata would be slow
+    user_config_path = appdirs.user_config_dir(__package__)
     user_config_path = "{}.toml".format(user_config_path)
     return user_config_path
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+
+from luma.core.device import dummy
+from luma.core.interface.serial import i2c
+from luma.oled.device import sh1106
+from PIL import Image
+
+
+# SH1106 commands used for addressing (see SH1106 datasheet)
+SET_PAGE_ADDRESS = 0xB0
+SET_LOW_COLUMN   = 0x00
+SET_HIGH_COLUMN  = 0x10
+
+# Number of command bytes needed to address a span of a page. Changed spans
+# that are closer to each other than this are sent as a single span
+SPAN_OVERHEAD = 3
+
+
+
+
+def pack_pages(image, pages: int):
+    """
+    Pack a 1-bit image into SH1106 pages: one bytes object per 8 pixel row,
+    holding one byte per column with the topmost pixel in the lowest bit
+    """
+    # Rotating puts the eight pixels of every column/page into one byte
+    raw = image.transpose(Image.ROTATE_270).tobytes()
+    return [raw[pages-1-p::pages] for p in range(pages)]
+
+
+def changed_spans(old: bytes, new: bytes):
+    """
+    Return a list of (start, end) column ranges in which old and new differ.
+    Ranges that are separated by less than SPAN_OVERHEAD unchanged columns are
+    merged, because addressing them separately would cost more than resending
+    """
+    spans = []
+    start = None
+    end = None
+    for x in range(len(new)):
+        if old[x] != new[x]:
+            if start is None:
+                start = x
+            elif x - end > SPAN_OVERHEAD:
+                spans.append((start, end))
+                start = x
+            end = x + 1
+    if start is not None:
+        spans.append((start, end))
+    return spans
+
+
+
+
+class DiffSH1106(sh1106):
+    """
+    A SH1106 OLED Display that remembers the last frame it sent and only sends
+    the column ranges of each page that changed since then (using the page and
+    column addressing of the SH1106). A frame with a few changed meter bars is
+    a fraction of the full 8 pages x 128 bytes.
+
+    bytes_sent, last_frame_bytes and frames keep track of the traffic (command
+    and data bytes, without the I2C framing)
+    """
+
+    def __init__(self, serial_interface=None, **kwargs):
+        # These need to exist before the parent class clears the display
+        self.last_pages       = None
+        self.bytes_sent       = 0
+        self.last_frame_bytes = 0
+        self.frames           = 0
+        super().__init__(serial_interface, **kwargs)
+
+    @property
+    def column_offset(self) -> int:
+        """
+        The SH1106 has 132 columns of RAM, the visible 128 start at this offset
+        """
+        return getattr(self, "_page_address_offset", 0x02)
+
+    def invalidate(self):
+        """
+        Forget the last frame, so the next frame is sent in full (e.g. after
+        the display lost power)
+        """
+        self.last_pages = None
+
+    def display(self, image):
+        """
+        Takes a 1-bit PIL.Image and sends the parts of it that changed since
+        the last frame to the display
+        """
+        assert image.mode == self.mode
+        assert image.size == self.size
+
+        image = self.preprocess(image)
+        n_pages = self._h // 8
+        pages = pack_pages(image, n_pages)
+
+        sent = 0
+        for p, page in enumerate(pages):
+            if self.last_pages is None:
+                spans = [(0, self._w)]
+            elif self.last_pages[p] == page:
+                continue
+            else:
+                spans = changed_spans(self.last_pages[p], page)
+
+            for start, end in spans:
+                column = start + self.column_offset
+                self.command(
+                    SET_PAGE_ADDRESS | p,
+                    SET_LOW_COLUMN | (column & 0x0F),
+                    SET_HIGH_COLUMN | (column >> 4))
+                self.data(list(page[start:end]))
+                sent += SPAN_OVERHEAD + end - start
+
+        self.last_pages = pages
+        self.last_frame_bytes = sent
+        self.bytes_sent += sent
+        self.frames += 1
+
+
+
+
+class FramebufferDevice(dummy):
+    """
+    A headless display with the same interface as the SH1106 devices: frames
+    are rendered into an in-memory 128x64 1-bit image (self.image). If png_dir
+    is given, every frame is also written there as a numbered PNG file.
+
+    This makes it possible to run and measure the render path on any machine
+    """
+
+    def __init__(self, width=128, height=64, png_dir=None, name="display"):
+        super().__init__(width=width, height=height, mode="1")
+        self.png_dir = png_dir
+        self.name    = name
+        self.frames  = 0
+
+        if self.png_dir is not None:
+            os.makedirs(self.png_dir, exist_ok=True)
+
+    def display(self, image):
+        super().display(image)
+        if self.png_dir is not None:
+            path = os.path.join(self.png_dir, "{}-{:06d}.png".format(self.name, self.frames))
+            self.image.save(path)
+        self.frames += 1
+
+
+
+
+def create_device(section, name="display"):
+    """
+    Create the display device for a display section of the config. The
+    optional key backend selects "sh1106" (default) or "framebuffer", the
+    latter optionally dumps its frames as PNGs into png_dir
+    """
+    backend = section.get("backend", "sh1106")
+    if backend == "framebuffer":
+        return FramebufferDevice(png_dir=section.get("png_dir"), name=name)
+    elif backend == "sh1106":
+        serial = i2c(port=section["i2c_port"], address=section["i2c_address"])
+        return DiffSH1106(serial)
+    else:
+        raise ValueError("Unknown display backend \"{}\" (use \"sh1106\" or \"framebuffer\")".format(backend))
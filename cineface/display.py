@@ -1,13 +1,99 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import io
-from luma.core.interface.serial import i2c
+from collections import OrderedDict
 from luma.core.render import canvas
-from luma.oled.device import sh1106, ssd1306
 from PIL import ImageFont, ImageDraw, Image
 
-from cineface.totalmix import db_to_fader, fader_to_db
+from cineface.curve import db_to_fader, fader_to_db
+from cineface.devices import create_device
+from cineface.layout import LevelLayout
+
+
+
+
+def format_db(value) -> str:
+    """
+    Format a dB value for the VolumeDisplay (e.g. "+3.5", " 0.0" or "-∞")
+    """
+    if value is None:
+        return "n.a."
+    if value == 0.0:
+        return " 0.0"
+    elif value <= -65.0:
+        return "-∞"
+    elif value > 0.0:
+        return "+{:.1f}".format(value)
+    elif value < 0.0:
+        return "{:.1f}".format(value)
+
+
+def text_size(draw, text, font):
+    """
+    Return the (width, height) of a text. Newer versions of Pillow only
+    offer textbbox, older ones only textsize
+    """
+    if hasattr(draw, "textbbox"):
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        return right, bottom
+    return draw.textsize(text, font)
+
+
+def all_db_texts():
+    """
+    Every text format_db() returns for the range of the TotalMix faders
+    """
+    texts = [format_db(None), format_db(-65.0)]
+    texts.extend(format_db(tenths / 10) for tenths in range(-649, 61))
+    return texts
+
+
+
+
+class FrameCache():
+    """
+    A bounded LRU cache of fully rendered frames. Frames are rendered by
+    calling render(*key) the first time a key is requested, after that they
+    are returned from the cache until they become the least recently used
+    frame of a full cache
+    """
+
+    def __init__(self, render, maxsize=256):
+        self.render  = render
+        self.maxsize = maxsize
+        self.frames  = OrderedDict()
+
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, key):
+        return key in self.frames
+
+    def get(self, key):
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.hits += 1
+            self.frames.move_to_end(key)
+            return frame
+
+        self.misses += 1
+        frame = self.render(*key)
+        self.frames[key] = frame
+        if len(self.frames) > self.maxsize:
+            self.frames.popitem(last=False)
+            self.evictions += 1
+        return frame
+
+    def clear(self):
+        self.frames.clear()
+
+    def stats(self) -> str:
+        return "{} frames cached, {} hits, {} misses, {} evictions".format(
+            len(self.frames), self.hits, self.misses, self.evictions)
 
 
 
@@ -20,10 +106,16 @@ class VolumeDisplay():
 
     If the volumes of all unmuted channels that aren't named headphones doesn't line
     up (so e.g. if the Center channel is accidentally dimmed by -3 dB) a white square
-    is displayed in the top left corner.
+    is displayed in the top left corner. While the volume might be outdated
+    because TotalMix doesn't answer, a dotted frame is drawn around the display.
 
     If the VolumeDisplay is set to inactive in the config, it is not loaded at all
     and does nothing (otherwise there will be an error if no display is connected)
+
+    A frame is only rendered and sent to the display if its visible content
+    changed since the last one, all other frames are skipped and counted.
+    Rendered frames are kept in a FrameCache, so showing a value that was
+    displayed before (or that was prerendered on startup) is a single blit
     """
 
     def __init__(self):
@@ -33,53 +125,142 @@ class VolumeDisplay():
         self.font   = None
         self.value  = None
         self.has_uniform_volume = True
+        self.stale  = False
+
+        # Maximum number of frames per second
+        self.max_fps = 10
+
+        # The state that is currently shown on the display (None if unknown)
+        self.rendered_state = None
+
+        # Count how many frames were rendered and how many were skipped
+        self.frames_rendered = 0
+        self.frames_skipped  = 0
+
+        # Prerendered frames, keyed by (text, has_uniform_volume, stale)
+        self.cache = FrameCache(self.render_frame)
 
     def from_config(self, config) -> 'VolumeDisplay':
         # Temporary Variables
         active  = config["VolumeDisplay"]["active"]
         address = config["VolumeDisplay"]["i2c_address"]
         port    = config["VolumeDisplay"]["i2c_port"]
-        font    = config["VolumeDisplay"]["font"]
-        size    = config["VolumeDisplay"]["size"]
 
         # Set the initial values
         self.active = active
         if self.active:
-            self.serial = i2c(port=port, address=address)
-            self.device = sh1106(self.serial)
-            self.font = ImageFont.truetype(font, size)
+            self.device = create_device(config["VolumeDisplay"], "volume")
+            self.serial = getattr(self.device, "_serial_interface", None)
 
             print("Setting up LevelDisplay at i2c address {}".format(address))
 
+        return self.configure(config)
+
+    def configure(self, config) -> 'VolumeDisplay':
+        """
+        Apply the settings that can change while running (font, frame rate and
+        cache), also used when the config is reloaded
+        """
+        font    = config["VolumeDisplay"]["font"]
+        size    = config["VolumeDisplay"]["size"]
+        max_fps = config["VolumeDisplay"].get("max_fps", self.max_fps)
+        cache_size = config["VolumeDisplay"].get("cache_size", self.cache.maxsize)
+        warm_up = config["VolumeDisplay"].get("warm_up_cache", False)
+
+        self.max_fps = max_fps
+
+        # Frames rendered with the old settings are useless now
+        self.cache = FrameCache(self.render_frame, cache_size)
+        self.invalidate()
+
+        if self.active:
+            self.font = ImageFont.truetype(font, size)
+            if warm_up:
+                self.warm_up()
+
         return self
 
     @property
     def text(self):
-        if self.value is None:
-            return "n.a."
-        if self.value == 0.0:
-            return " 0.0"
-        elif self.value <= -65.0:
-            return "-∞"
-        elif self.value > 0.0:
-            return "+{:.1f}".format(self.value)
-        elif self.value < 0.0:
-            return "{:.1f}".format(self.value)
+        return format_db(self.value)
+
+    def render_frame(self, text, has_uniform_volume, stale=False):
+        """
+        Render a complete frame for the given text and warning states
+        """
+        image = Image.new(self.device.mode, self.device.size)
+        draw = ImageDraw.Draw(image)
+        draw.text((0, 5), text, font=self.font, fill="white")
+
+        # If not all channels have uniform volume, draw a white square as warning
+        if not has_uniform_volume:
+            draw.rectangle([(0, 0), (10, 10)], outline="white", fill="white")
+
+        # If the volume might be outdated, draw a dotted frame
+        if stale:
+            w, h = image.size
+            for x in range(0, w, 4):
+                draw.point([(x, 0), (x, h-1)], fill="white")
+            for y in range(0, h, 4):
+                draw.point([(0, y), (w-1, y)], fill="white")
+
+        return image
+
+    def warm_up(self):
+        """
+        Prerender the frames for every possible text (as many as fit into the
+        cache, starting with the uniform volume ones)
+        """
+        for has_uniform_volume in (True, False):
+            for text in all_db_texts():
+                if len(self.cache) >= self.cache.maxsize:
+                    break
+                self.cache.get((text, has_uniform_volume, False))
+        print("Prerendered {} VolumeDisplay frames".format(len(self.cache)))
+
+    @property
+    def state(self):
+        """
+        Everything that is visible on the display. Values that format to the
+        same text look the same, so only the text is part of the state
+        """
+        return (self.text, self.has_uniform_volume, self.stale)
+
+    def invalidate(self):
+        """
+        Force the next call to draw() to render a frame
+        """
+        self.rendered_state = None
 
     def draw(self):
         if self.active:
-            with canvas(self.device) as draw:
-                # draw.rectangle(device.bounding_box, outline="white", fill="black")
-                draw.text((0, 5), self.text, font=self.font, fill="white")
+            state = self.state
+            if state == self.rendered_state:
+                self.frames_skipped += 1
+                return
 
-                # If not all channels have uniform volume, draw a white square as warning
-                if not self.has_uniform_volume:
-                    draw.rectangle([(0, 0), (10, 10)], outline="white", fill="white")
+            self.device.display(self.cache.get(state))
 
-    def update(self, value, has_uniform_volume=True):
+            self.rendered_state = state
+            self.frames_rendered += 1
+
+    def update(self, value, has_uniform_volume=True, stale=False):
         if self.active:
             self.value = float(value)
             self.has_uniform_volume = has_uniform_volume
+            self.stale = stale
+
+    def render(self, snapshot):
+        """
+        Update and draw from a (value, has_uniform_volume, stale) snapshot
+        (this is what the RenderWorker calls)
+        """
+        self.update(*snapshot)
+        self.draw()
+
+    def stats(self) -> str:
+        return "{} frames rendered, {} skipped (cache: {})".format(
+            self.frames_rendered, self.frames_skipped, self.cache.stats())
 
 
 
@@ -94,6 +275,9 @@ class LevelDisplay():
     up (so e.g. if the Center channel is accidentally dimmed by -3 dB) a white square
     is displayed in the top left corner.
 
+    Outputs whose values might be outdated because TotalMix doesn't answer are
+    drawn with hollow meter bars.
+
     If the LevelDisplay is set to inactive in the config, it is not loaded at all
     and does nothing (otherwise there will be an error if no display is connected)
     """
@@ -106,6 +290,13 @@ class LevelDisplay():
         self.font_small = None
         self.db_markers = None
         self.scale      = None
+        self.max_fps    = 30
+
+        # The dB scale doesn't change between frames, so it is rendered once
+        # into this image and every frame starts from a copy of it. The key
+        # holds everything the image depends on
+        self.background     = None
+        self.background_key = None
 
         # Some geometric constants
         # Width and height of screen
@@ -143,36 +334,70 @@ class LevelDisplay():
         # Scale the bar up to zero db (so we don't waste vertical space)
         self.barheight = self.barheight / self.zerodb
 
+        # Positions of all bars, labels and mute icons (see compile_layout)
+        self.layout = LevelLayout(
+            w=self.w,
+            h=self.h,
+            slots=self.slots,
+            barwidth=self.barwidth,
+            margin_bottom=self.margin_bottom
+        )
+
     def from_config(self, config) -> 'LevelDisplay':
         # Temporary Variables
         active       = config["LevelDisplay"]["active"]
         address      = config["LevelDisplay"]["i2c_address"]
         port         = config["LevelDisplay"]["i2c_port"]
+
+        # Set the initial values
+        self.active  = active
+        if self.active:
+            self.device     = create_device(config["LevelDisplay"], "levels")
+            self.serial     = getattr(self.device, "_serial_interface", None)
+            self.font       = ImageFont.truetype("fonts/Inter-Medium.ttf", 10)
+            self.font_small = ImageFont.truetype("fonts/Inter-Light.ttf", 7)
+
+            print("Setting up LevelDisplay at i2c address {}".format(address))
+
+        return self.configure(config)
+
+    def configure(self, config) -> 'LevelDisplay':
+        """
+        Apply the settings that can change while running (scale, placement of
+        the outputs and frame rate), also used when the config is reloaded
+        """
         left         = config["LevelDisplay"]["left"]
         right        = config["LevelDisplay"]["right"]
+        max_fps      = config["LevelDisplay"].get("max_fps", self.max_fps)
         if "db_markers" in config["LevelDisplay"].keys():
             db_markers = config["LevelDisplay"]["db_markers"]
             scale      = [db_to_fader(db) for db in db_markers]
         else:
             db_markers = None
+            scale      = None
 
-        # Set the initial values
-        self.active = active
+        self.max_fps = max_fps
         if self.active:
-            self.serial     = i2c(port=port, address=address)
-            self.device     = sh1106(self.serial)
-            self.font       = ImageFont.truetype("fonts/Inter-Medium.ttf", 10)
-            self.font_small = ImageFont.truetype("fonts/Inter-Light.ttf", 7)
             self.left       = left
             self.right      = right
             self.db_markers = db_markers
             self.scale      = scale
-
-            print("Setting up LevelDisplay at i2c address {}".format(address))
+            self.compile_layout(config["Output"])
+            self.invalidate_background()
 
         return self
 
 
+    def compile_layout(self, outputs):
+        """
+        Compute the positions of everything that is drawn for the outputs
+        (given as the [[Output]] sections of the config)
+        """
+        draw = ImageDraw.Draw(Image.new("1", (1, 1)))
+        measure = lambda text: text_size(draw, text, self.font)
+        outputs = [(o["name"], o["short"], o["stereo"]) for o in outputs]
+        self.layout.compile(outputs, self.left, self.right, measure)
+
     def draw_scale(self, draw, slot):
         """
         Draw a dB scale
@@ -193,7 +418,7 @@ class LevelDisplay():
             text = "{:.0f}".format(db)
 
             # Get the text width
-            w, h = draw.textsize(text, self.font_small)
+            w, h = text_size(draw, text, self.font_small)
 
             # If the label is on the very top, push it down
             if y-h/2 < 0:
@@ -211,122 +436,74 @@ class LevelDisplay():
             draw.rectangle([(coords[0]-3, coords[1]), (center[0]+w/2+3, y+h/2)], outline="black", fill="black")
             draw.text(coords, text, font=self.font_small, fill="white")
 
+    def scale_background(self, slot):
+        """
+        Return an image with the dB scale drawn at the given slot. The image is
+        only rendered again if the markers or the slot changed
+        """
+        key = (tuple(self.db_markers), slot)
+        if key != self.background_key:
+            self.background = Image.new(self.device.mode, self.device.size)
+            self.draw_scale(ImageDraw.Draw(self.background), slot)
+            self.background_key = key
+        return self.background
+
+    def invalidate_background(self):
+        """
+        Force the dB scale to be rendered again on the next frame
+        """
+        self.background_key = None
 
+    def render(self, snapshot):
+        """
+        Draw a snapshot of the outputs (this is what the RenderWorker calls)
+        """
+        self.draw(snapshot)
 
     def draw(self, outputs):
         # if inactive just return
         if not self.active:
             return
 
-        # Draw on canvas
-        with canvas(self.device) as draw:
+        # Start from the dB scale if there are values in the config
+        background = None
+        if not self.db_markers is None:
+            background = self.scale_background(self.layout.scale_slot)
 
-            # Draw the dB scale if there are values in the config
-            if not self.db_markers is None:
-                # Get a count of right channels to position the db bar so we can position the value labels
-                n_right = sum([2 for o in outputs if o.name is not None and o.name in self.right and o.stereo])
-                n_right += sum([1 for o in outputs if o.name is not None and o.name in self.right and o.mono])
-
-                self.draw_scale(draw, self.slots-n_right)
-
-            n = 0
-            # Draw the left aligned outputs first
-            for output in [o for o in outputs if o.name is not None and o.name in self.left]:
-                # If the outputs aren't ready yet just skip drawing them
-                if output.stereo and (output.levels["L"] is None or output.levels["R"] is None or output.mute is None):
-                    continue
-
-                # Do the same for mono outputs
-                if output.mono and (output.levels is None or output.mute is None):
+        # Draw on canvas
+        with canvas(self.device, background=background) as draw:
+            for output in outputs:
+                layout = self.layout.get(output.name)
+                if layout is None:
                     continue
 
-                # Draw level meter bars
-                if output.stereo:
-                    # Stereo channels take up two slots
-                    draw.rectangle([(n*self.slotwidth, self.b+output.levels["L"]*-self.barheight), (n*self.slotwidth+self.barwidth, self.b)], outline="white", fill="white")
-                    n += 1
-                    draw.rectangle([(n*self.slotwidth, self.b+output.levels["R"]*-self.barheight), (n*self.slotwidth+self.barwidth, self.b)], outline="white", fill="white")
-                    n += 1
-                else:
-                    # Mono channels take up one slot
-                    draw.rectangle([(n*self.slotwidth, self.b+output.levels*-self.barheight), (n*self.slotwidth+self.barwidth, self.b)], outline="white", fill="white")
-                    n += 1
-
-                # Draw Channel Names and Mute icons
-                if output.mute and output.mono:
-                    # Draw Mute Icon if channel muted
-                    x = n-1
-                    draw.rectangle([(x*self.slotwidth, self.b+2), (x*self.slotwidth+self.barwidth, self.h)], outline="white", fill="white")
-                    draw.text((x*self.slotwidth, self.b), "M", font=self.font, fill="black")
-                elif output.mute and output.stereo:
-                    # Draw Mute Icon if channel muted
-                    x = n-2
-                    draw.rectangle([(x*self.slotwidth, self.b+2), (x*self.slotwidth+self.slotwidth+self.barwidth, self.h)], outline="white", fill="white")
-                    draw.text((x*self.slotwidth+(self.slotwidth//2), self.b), "M", font=self.font, fill="black")
-                elif output.stereo:
-                    # Display short output name if not muted
-                    x = n-2
-                    text = output.short
-                    w, h = draw.textsize(text, self.font)
-                    center = (x*self.slotwidth+self.slotwidth-self.gutter/2, self.b)
-                    coords = (center[0]-w/2, self.b)
-                    draw.text(coords, text, font=self.font, fill="white")
-                elif output.mono:
-                    # Display short output name if not muted
-                    x = n-1
-                    text = output.short
-                    w, h = draw.textsize(text, self.font)
-                    center = (x*self.slotwidth+self.barwidth/2, self.b)
-                    coords = (center[0]-w/2, self.b)
-                    draw.text(coords, text, font=self.font, fill="white")
-
-            # Draw right aligned outputs here (see config)
-            n = 0
-            for output in [o for o in outputs if o.name is not None and o.name in self.right]:
                 # If the outputs aren't ready yet just skip drawing them
-                if output.stereo and (output.levels["L"] is None or output.levels["R"] is None or output.mute is None):
+                if output.mute is None or output.levels is None:
                     continue
-
-                # Do the same for mono outputs
-                if not output.stereo and (output.levels is None or output.mute is None):
+                if output.stereo and (output.levels["L"] is None or output.levels["R"] is None):
                     continue
-                # Draw level meter bars
-                if output.stereo:
-                    draw.rectangle([(self.w-(n*self.slotwidth), self.b+output.levels["R"]*-self.barheight), (self.w-(n*self.slotwidth+self.barwidth), self.b)], outline="white", fill="white")
-                    n += 1
-                    draw.rectangle([(self.w-(n*self.slotwidth), self.b+output.levels["L"]*-self.barheight), (self.w-(n*self.slotwidth+self.barwidth), self.b)], outline="white", fill="white")
-                    n += 1
+
+                # Draw level meter bars (hollow ones if the output is stale)
+                fill = "black" if output.stale else "white"
+                for bar in layout.bars:
+                    if bar.channel is None:
+                        level = output.levels
+                    else:
+                        level = output.levels[bar.channel]
+                    draw.rectangle([(bar.x0, self.b+level*-self.barheight), (bar.x1, self.b)], outline="white", fill=fill)
+
+                    # Draw the peak hold marker
+                    if output.peaks is not None:
+                        if bar.channel is None:
+                            peak = output.peaks
+                        else:
+                            peak = output.peaks[bar.channel]
+                        y = self.b+peak*-self.barheight
+                        draw.line([(bar.x0, y), (bar.x1, y)], fill="white")
+
+                # Draw Mute icons or Channel Names
+                if output.mute:
+                    draw.rectangle(layout.mute_rect, outline="white", fill="white")
+                    draw.text(layout.mute_text, "M", font=self.font, fill="black")
                 else:
-                    draw.rectangle([(self.w-(n*self.slotwidth), self.b+output.levels*-self.barheight), (self.w-(n*self.slotwidth+self.barwidth), self.b)], outline="white", fill="white")
-                    n += 1
-
-                # Draw Channel Names and Mute icons
-                if output.mute is not None:
-                    if output.mute and not output.stereo:
-                        # Display "M" Mute label if muted
-                        x = n-1
-                        draw.rectangle([(self.w-(x*self.slotwidth), self.b+2), (self.w-(x*self.slotwidth+self.barwidth), self.h)], outline="white", fill="white")
-                        draw.text((self.w-(x*self.slotwidth), self.b), "M", font=self.font, fill="black")
-                    elif output.mute and output.stereo:
-                        # Display "M" Mute label if muted
-                        x = n-2
-                        draw.rectangle([(self.w-(x*self.slotwidth), self.b+2), (self.w-(x*self.slotwidth+self.slotwidth+self.barwidth), self.h)], outline="white", fill="white")
-                        draw.text((self.w-(x*self.slotwidth+self.slotwidth+1), self.b), "M", font=self.font, fill="black")
-                    elif output.stereo:
-                        # Display short output name if not muted
-                        x = n-2
-                        text = output.short
-                        w, h = draw.textsize(text, self.font)
-                        center = (self.w-self.slotwidth+self.gutter, self.b)
-                        coords = (center[0]-w/2, self.b)
-                        draw.text(coords, text, font=self.font, fill="white")
-                    elif not output.stereo:
-                        # Display short output name if not muted
-                        x = n-1
-                        text = output.short
-                        w, h = draw.textsize(text, self.font)
-                        center = (self.w-self.slotwidth, self.b)
-                        coords = (center[0]-w/2, self.b)
-                        draw.text(coords, text, font=self.font, fill="white")
-
-                
\ No newline at end of file
+                    draw.text(layout.label, layout.short, font=self.font, fill="white")
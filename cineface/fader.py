@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import os
+import random
+import sys
+import threading
+from array import array
+from time import perf_counter, sleep
+
+from cineface.curve import CURVE, FaderCurve
+from cineface.helpers import clamp, nothing
+from cineface.latency import Histogram, format_seconds
+
+
+
+
+class PID():
+    """
+    PID controller with the output limited to -limit..limit. The integral
+    only accumulates while the output isn't saturated (no windup while the
+    motor runs at full speed)
+    """
+
+    def __init__(self, kp=12.0, ki=4.0, kd=0.15, limit=1.0):
+        self.kp    = kp
+        self.ki    = ki
+        self.kd    = kd
+        self.limit = limit
+        self.reset()
+
+    def reset(self):
+        self.integral   = 0.0
+        self.last_error = None
+
+    def update(self, error: float, dt: float) -> float:
+        if self.last_error is None or dt <= 0.0:
+            derivative = 0.0
+        else:
+            derivative = (error - self.last_error) / dt
+        self.last_error = error
+
+        integral = self.integral + error * dt
+        output = self.kp * error + self.ki * integral + self.kd * derivative
+        if -self.limit < output < self.limit:
+            self.integral = integral
+        return clamp(output, -self.limit, self.limit)
+
+
+
+
+class SimulatedFader():
+    """
+    A motor fader without hardware: the knob is moved by a motor with a
+    top speed (in travel per second at full drive) and a time constant,
+    drives below stiction don't move it at all. The position is read back
+    through an ADC with noise and a resolution of bits.
+
+    Used to tune the control loop and to measure its timing on any machine
+    """
+
+    def __init__(self, speed=3.0, time_constant=0.02, stiction=0.1, noise=0.001, bits=10, position=0.0):
+        self.speed         = speed
+        self.time_constant = time_constant
+        self.stiction      = stiction
+        self.noise         = noise
+        self.steps         = 2 ** bits - 1
+
+        self.position = position
+        self.velocity = 0.0
+        self.drive_speed = 0.0
+        self.last = perf_counter()
+
+    def advance(self):
+        now = perf_counter()
+        dt = now - self.last
+        self.last = now
+
+        target = 0.0 if abs(self.drive_speed) < self.stiction else self.drive_speed * self.speed
+        self.velocity += (target - self.velocity) * (1.0 - math.exp(-dt / self.time_constant))
+        self.position += self.velocity * dt
+        if not 0.0 <= self.position <= 1.0:
+            # The knob hit the end of the travel
+            self.position = clamp(self.position, 0.0, 1.0)
+            self.velocity = 0.0
+
+    def read_position(self) -> float:
+        self.advance()
+        position = self.position + random.gauss(0.0, self.noise)
+        return round(clamp(position, 0.0, 1.0) * self.steps) / self.steps
+
+    def drive(self, speed: float):
+        self.advance()
+        self.drive_speed = clamp(speed, -1.0, 1.0)
+
+    def close(self):
+        pass
+
+
+
+
+class L293DFader():
+    """
+    A motor fader driven by an L293D H-bridge (forward, backward and the PWM
+    enable pin), its position read from a MCP3001 ADC over SPI. Without the
+    motor pins only the position is read (a plain potentiometer)
+    """
+
+    def __init__(self, forward=None, backward=None, enable=None):
+        # gpiozero is slow to import, only do it if there is a fader
+        from gpiozero import Motor, MCP3001
+        self.motor = None
+        if forward is not None:
+            self.motor = Motor(forward=forward, backward=backward, enable=enable, pwm=True)
+            print("Setting up motor fader (Pins: {}/{}/{})".format(forward, backward, enable))
+        self.adc = MCP3001()
+
+    def read_position(self) -> float:
+        return self.adc.value
+
+    def drive(self, speed: float):
+        if self.motor is None:
+            return
+        if speed > 0.0:
+            self.motor.forward(min(speed, 1.0))
+        elif speed < 0.0:
+            self.motor.backward(min(-speed, 1.0))
+        else:
+            self.motor.stop()
+
+    def close(self):
+        if self.motor is not None:
+            self.motor.close()
+        self.adc.close()
+
+
+
+
+def create_driver(section):
+    """
+    Create the fader driver for the [Fader] section of the config. The key
+    backend selects "l293d" (default) or "simulated"
+    """
+    backend = section.get("backend", "l293d")
+    if backend == "simulated":
+        return SimulatedFader()
+    elif backend == "l293d":
+        if not section.get("motor", True):
+            return L293DFader()
+        return L293DFader(
+            forward=section["motor_forward"],
+            backward=section["motor_backward"],
+            enable=section["motor_enable"]
+        )
+    else:
+        raise ValueError("Unknown fader backend \"{}\" (use \"l293d\" or \"simulated\")".format(backend))
+
+
+def travel_to_volume(travel: float, scale) -> float:
+    """
+    The volume (TotalMix fader position) shown at a position on the travel of
+    a fader with the given scale (a FaderCurve of the dB values printed along
+    the travel)
+    """
+    return CURVE.to_fader(scale.to_db(travel))
+
+
+def volume_to_travel(volume: float, scale) -> float:
+    """
+    The position on the travel of a fader with the given scale that shows the
+    volume
+    """
+    return scale.to_fader(CURVE.to_db(volume))
+
+
+
+
+class FixedRateThread():
+    """
+    Calls step(dt) rate times per second on its own thread, dt is the time
+    since the previous call (in seconds). The loop sleeps
+    until absolute deadlines, so a late cycle doesn't shift the following
+    ones. How late every cycle woke up (jitter), how long the step took and
+    how many deadlines were missed (overruns) are recorded, see stats()
+    """
+
+    def __init__(self, step, rate):
+        self.step    = step
+        self.rate    = rate
+        self.running = False
+        self.thread  = None
+
+        # Timing statistics
+        self.cycles    = 0
+        self.overruns  = 0
+        self.jitter    = Histogram()
+        self.step_time = Histogram()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        # Ask for realtime scheduling of this thread, this needs privileges and
+        # is just skipped if they are missing
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+        except (AttributeError, OSError):
+            pass
+
+        # Let the interpreter switch to this thread at least once per cycle
+        # (the default 5 ms are longer than a cycle), while it runs
+        period = 1.0 / self.rate
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, period / 2))
+        try:
+            self.loop(period)
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+    def loop(self, period):
+        deadline = perf_counter()
+        last = deadline
+        while self.running:
+            now = perf_counter()
+            if now < deadline:
+                sleep(deadline - now)
+                now = perf_counter()
+            self.jitter.record(now - deadline)
+
+            self.step(now - last)
+            last = now
+
+            done = perf_counter()
+            self.step_time.record(done - now)
+            self.cycles += 1
+
+            deadline += period
+            if done > deadline:
+                # Missed the next deadline, start over from now instead of
+                # running a burst of cycles to catch up
+                self.overruns += 1
+                deadline = done
+
+    def stats(self) -> str:
+        return "{} cycles at {:g} Hz, jitter p50 {} p99 {} max {}, step p99 {}, {} overruns".format(
+            self.cycles,
+            self.rate,
+            format_seconds(self.jitter.percentile(50)),
+            format_seconds(self.jitter.percentile(99)),
+            format_seconds(self.jitter.max),
+            format_seconds(self.step_time.percentile(99)),
+            self.overruns)
+
+
+
+
+class VolumeSampler(FixedRateThread):
+    """
+    Turns noisy ADC readings of the volume potentiometer into the few volume
+    changes worth sending to TotalMix.
+
+    Readings (fractions of the travel) go into a ring buffer of size samples
+    and are filtered with a running median (robust against single spikes) or
+    an exponential moving average with the factor alpha. The filtered value
+    has to move further than deadband from the last emitted position before
+    it is followed, once it moves the smaller hysteresis is enough (so a
+    slow movement isn't swallowed, but a resting knob stays quiet). Positions
+    are converted into volumes through the scale of the fader and only
+    emitted (on_volume(volume)) if they differ by at least min_db from the
+    last emitted one.
+
+    Readings are either taken by the sampler itself (start() reads read() on
+    its own thread at rate), or fed into add() by another fixed-rate loop
+    that reads the ADC anyway (the MotorFader). samples and emitted count
+    readings and emitted volumes
+    """
+
+    def __init__(self, read=None, rate=200.0, size=9, filter="median", alpha=0.2, deadband=0.004, hysteresis=0.002, min_db=0.2, scale=None):
+        super().__init__(self.sample, rate)
+        self.read       = read
+        self.filter     = filter
+        self.alpha      = alpha
+        self.deadband   = deadband
+        self.hysteresis = hysteresis
+        self.min_db     = min_db
+        self.scale      = scale or CURVE
+
+        # Ring buffer of the last readings
+        self.buffer = array("d", [0.0] * size)
+        self.index  = 0
+        self.filled = 0
+
+        # Filtered position, the position that was last emitted (or held) and
+        # whether the knob is moving
+        self.value     = None
+        self.reference = None
+        self.moving    = False
+
+        # The last emitted volume in dB
+        self.db = None
+
+        self.samples = 0
+        self.emitted = 0
+
+        # Called with every emitted volume (on the sampling thread)
+        self.on_volume = lambda volume: None
+
+    def from_config(self, config) -> 'VolumeSampler':
+        section = config["Fader"]
+        self.rate       = section.get("sample_rate", self.rate)
+        self.filter     = section.get("filter", self.filter)
+        self.alpha      = section.get("alpha", self.alpha)
+        self.deadband   = section.get("deadband", self.deadband)
+        self.hysteresis = section.get("hysteresis", self.hysteresis)
+        self.min_db     = section.get("min_db", self.min_db)
+        if "samples" in section:
+            self.buffer = array("d", [0.0] * section["samples"])
+        if "scale" in section:
+            self.scale = FaderCurve([tuple(point) for point in section["scale"]])
+        if self.filter not in ("median", "ema"):
+            raise ValueError("Unknown fader filter \"{}\" (use \"median\" or \"ema\")".format(self.filter))
+        return self
+
+    def sample(self, dt: float):
+        self.add(self.read())
+
+    def filtered(self, reading: float) -> float:
+        """
+        Put a reading into the ring buffer and return the filtered position
+        """
+        self.buffer[self.index] = reading
+        self.index = (self.index + 1) % len(self.buffer)
+        self.filled = min(self.filled + 1, len(self.buffer))
+
+        if self.filter == "ema":
+            if self.value is None:
+                return reading
+            return self.value + self.alpha * (reading - self.value)
+
+        if self.filled < len(self.buffer):
+            window = sorted(self.buffer[:self.filled])
+        else:
+            window = sorted(self.buffer)
+        return window[len(window) // 2]
+
+    def add(self, reading: float, hold=False):
+        """
+        Process one reading of the ADC. With hold, the reading only goes
+        through the filter and is accepted without being emitted (e.g. while
+        the motor moves the knob)
+        """
+        self.samples += 1
+        self.value = self.filtered(reading)
+
+        if hold:
+            self.hold()
+            return
+
+        # The position at startup is where TotalMix is, not a change. It is
+        # taken once the ring buffer is full and the filter has settled
+        if self.reference is None:
+            if self.filled == len(self.buffer):
+                self.reference = self.value
+            return
+
+        threshold = self.hysteresis if self.moving else self.deadband
+        if abs(self.value - self.reference) < threshold:
+            self.moving = False
+            return
+        self.moving = True
+        self.reference = self.value
+
+        volume = travel_to_volume(self.value, self.scale)
+        db = CURVE.to_db(volume)
+        if self.db is not None and abs(db - self.db) < self.min_db:
+            return
+
+        self.db = db
+        self.emitted += 1
+        self.on_volume(volume)
+
+    def emitted_volume(self, volume) -> bool:
+        """
+        Whether volume is (the echo of) the last emitted one
+        """
+        return self.db is not None and abs(CURVE.to_db(volume) - self.db) < 0.05
+
+    def hold(self, volume=None):
+        """
+        Accept the current position without emitting it (e.g. while the motor
+        moves the knob), optionally as the given volume
+        """
+        self.reference = self.value
+        self.moving = False
+        if volume is not None:
+            self.db = CURVE.to_db(volume)
+
+    def reduction(self) -> str:
+        ratio = self.emitted / self.samples * 100 if self.samples else 0.0
+        return "{} samples, {} volumes emitted ({:.2f}%)".format(self.samples, self.emitted, ratio)
+
+
+
+
+class MotorFader(FixedRateThread):
+    """
+    Moves a motor fader to the volume of the outputs with a fixed-rate PID
+    position loop on its own thread.
+
+    Positions are fractions of the fader travel as read by the ADC. scale is
+    a FaderCurve of the dB values printed along the travel, by default the
+    TotalMix FADER_CURVE (so the travel equals the TotalMix fader position).
+    A volume (a TotalMix fader position, like Outputs.fader_volume) is mapped
+    onto the travel through the dB value both curves share.
+
+    The motor stops once the knob arrived, so it can be moved by hand. If a
+    VolumeSampler is registered, every position read is also fed into it.
+    While the motor moves the knob, the sampler holds (the movement is not
+    sent back to TotalMix), and volumes the sampler emitted itself don't
+    become targets when TotalMix echoes them
+    """
+
+    def __init__(self, driver, rate=500.0, pid=None, scale=None, tolerance=0.004):
+        super().__init__(self.control, rate)
+        self.driver    = driver
+        self.pid       = pid or PID()
+        self.scale     = scale or CURVE
+        self.tolerance = tolerance
+        self.sampler   = None
+
+        # Target position (None: don't move) and the last position read
+        self.target   = None
+        self.position = None
+
+        # Cycles the sampler still holds after the motor stopped
+        self.settling = 0
+
+        # Guards replacing the target against consuming it on arrival
+        self.lock = threading.Lock()
+
+    def from_config(self, config) -> 'MotorFader':
+        section = config["Fader"]
+        self.rate = section.get("rate", self.rate)
+        self.tolerance = section.get("tolerance", self.tolerance)
+        self.pid = PID(
+            kp=section.get("kp", self.pid.kp),
+            ki=section.get("ki", self.pid.ki),
+            kd=section.get("kd", self.pid.kd)
+        )
+        if "scale" in section:
+            self.scale = FaderCurve([tuple(point) for point in section["scale"]])
+        return self
+
+    def register_sampler(self, sampler):
+        """
+        Feed the positions read by the control loop into a VolumeSampler
+        """
+        self.sampler = sampler
+
+    def travel(self, volume: float) -> float:
+        """
+        The position on the travel that shows the given volume
+        """
+        return volume_to_travel(volume, self.scale)
+
+    def volume(self, travel: float) -> float:
+        """
+        The volume shown at the given position on the travel
+        """
+        return travel_to_volume(travel, self.scale)
+
+    def set_volume(self, volume):
+        """
+        Move the fader to a volume (None or a silent volume stops the motor
+        where it is). Can be called from any thread
+        """
+        if volume is None or volume < 0.0:
+            target = None
+        elif self.sampler is not None and self.sampler.emitted_volume(volume):
+            return
+        else:
+            target = self.travel(volume)
+        with self.lock:
+            self.target = target
+
+    def control(self, dt: float):
+        """
+        One control cycle: read the position and drive the motor towards the
+        target
+        """
+        self.position = self.driver.read_position()
+        target = self.target
+
+        moving = target is not None and abs(target - self.position) > self.tolerance
+        if self.sampler is not None:
+            # Positions the motor drove the knob to are not sent, also not
+            # while the filter still settles after the motor stopped
+            if moving:
+                self.settling = len(self.sampler.buffer)
+            elif self.settling > 0:
+                self.settling -= 1
+            self.sampler.add(self.position, hold=moving or self.settling > 0)
+            if moving:
+                self.sampler.hold(self.volume(target))
+
+        if not moving:
+            if target is not None:
+                with self.lock:
+                    if self.target is target:
+                        self.target = None
+            self.pid.reset()
+            self.driver.drive(0.0)
+        else:
+            self.driver.drive(self.pid.update(target - self.position, dt))
+
+    def stop(self):
+        super().stop()
+        self.driver.drive(0.0)
+        self.driver.close()
@@ -1,39 +1,58 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import RPi.GPIO as GPIO
-from gpiozero import Button, LED
 from datetime import datetime
-import sys
-sys.path.append(".")
 
 from cineface.helpers import nothing
 
 class LedButton():
-    def __init__(self, button_pin, led_pin, mute, unmute):
+    def __init__(self, button_pin, led_pin, toggle):
         self.button_pin = button_pin
         self.led_pin = led_pin
-        self.mute = mute
-        self.unmute = unmute
+        self.toggle = toggle
+
+        # If set, presses are handed to this function (e.g. EventBridge.post)
+        # instead of being handled on gpiozero's thread
+        self.post = None
+
+        # gpiozero is slow to import, only do it once a button is needed
+        from gpiozero import Button, LED
         self.button = Button(self.button_pin, pull_up=True, bounce_time=0.01, hold_time=1.5)
         print("Setting up Button (Pin: {})".format(self.button_pin))
-        self.button.when_pressed = self.pressed
-        self.led = LED(self.led_pin)
+        try:
+            self.led = LED(self.led_pin)
+        except Exception:
+            # Don't keep the button pin when the LED can't be set up
+            self.button.close()
+            raise
+
+        # Only wire the callback once everything on_press uses exists, gpiozero
+        # can call it from its own thread right away
+        self.button.when_pressed = self.on_press
+
+    def close(self):
+        """
+        Release the GPIO pins (e.g. before they are set up again)
+        """
+        self.button.close()
+        self.led.close()
 
     def __cmp__(self, other):
         return self.button_pin == other.button_pin
 
+    def on_press(self):
+        if self.post is None:
+            self.pressed()
+        else:
+            self.post(self.pressed)
+
     def pressed(self):
         """
-        Fired if button was pressed and not held
+        Fired if button was pressed and not held. The LED is switched once
+        TotalMix reports the new mute state (see update_led)
         """
         print("Pressed (Pin: {}): {} -- {}".format(self.button_pin, datetime.now(), self))
-        if self.led.is_lit:
-            self.led.off()
-            self.mute()
-        else:
-            self.led.on()
-            self.unmute()
+        self.toggle()
     
     def update_led(self, mute):
         if mute:
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+from bisect import bisect_left
+from time import perf_counter
+
+
+# Upper bounds of the histogram buckets in seconds (the last bucket collects
+# everything above)
+BUCKETS = [
+    0.00005, 0.0001, 0.0002, 0.0005,
+    0.001, 0.002, 0.005,
+    0.01, 0.02, 0.05,
+    0.1, 0.2, 0.5,
+    1.0,
+]
+
+
+def percentile(values, p) -> float:
+    """
+    Return the p-th percentile of a list of values (exact, unlike
+    Histogram.percentile)
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def format_seconds(seconds) -> str:
+    if seconds < 0.001:
+        return "{:.0f}us".format(seconds * 1000000)
+    elif seconds < 1.0:
+        return "{:g}ms".format(round(seconds * 1000, 1))
+    return "{:g}s".format(seconds)
+
+
+
+
+class Histogram():
+    """
+    Counts durations in fixed buckets (see BUCKETS)
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.n      = 0
+        self.sum    = 0.0
+        self.max    = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.n += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p) -> float:
+        """
+        Upper bound of the bucket the p-th percentile falls into (at most the
+        maximum)
+        """
+        rank = p / 100.0 * self.n
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return 0.0
+
+    def format(self) -> str:
+        if self.n == 0:
+            return "no samples"
+        lines = ["n={} mean={} max={}".format(self.n, format_seconds(self.sum / self.n), format_seconds(self.max))]
+        for i, count in enumerate(self.counts):
+            if count == 0:
+                continue
+            if i < len(BUCKETS):
+                label = "<= {}".format(format_seconds(BUCKETS[i]))
+            else:
+                label = " > {}".format(format_seconds(BUCKETS[-1]))
+            lines.append("    {:>10} {:8d} {}".format(label, count, "#" * max(1, 40 * count // self.n)))
+        return "\n".join(lines)
+
+
+
+
+class Latency():
+    """
+    Optional latency instrumentation, from a datagram arriving to the frame
+    being on the panel. Durations are collected into one Histogram per stage:
+
+        receive>dispatch   datagram received until the output handler is called
+        dispatch>update    time spent in the output handler (Output.update)
+        <display> change>render   newest change until the frame is drawn
+        <display> draw     drawing the frame
+        <display> flush    sending the frame to the display (I2C)
+        <display> total    newest change until the frame is on the panel
+
+    Nothing is instrumented unless the instrument_* methods are called (which
+    main() only does when started with --latency), so a disabled Latency costs
+    nothing on the hot path
+    """
+
+    def __init__(self):
+        self.histograms = {}
+
+        # Arrival time of the datagram that is currently dispatched, and of the
+        # one that caused the latest state change
+        self.last_receive = 0.0
+        self.last_change  = 0.0
+
+        # Per display: duration of the flush of the current frame and the
+        # newest change that made it onto the panel
+        self.last_flush  = {}
+        self.last_origin = {}
+
+    def record(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.record(seconds)
+
+    def instrument_dispatcher(self, dispatcher):
+        """
+        Take the arrival time of every datagram the dispatcher handles
+        """
+        call_handlers_for_packet = dispatcher.call_handlers_for_packet
+
+        def timed(data, client_address):
+            self.last_receive = perf_counter()
+            return call_handlers_for_packet(data, client_address)
+
+        dispatcher.call_handlers_for_packet = timed
+
+    def wrap_handler(self, handler):
+        """
+        Return a handler that measures the dispatch and the update stage
+        """
+        def timed(addr, value):
+            start = perf_counter()
+            received = self.last_receive
+            self.record("receive>dispatch", start - received)
+            handler(addr, value)
+            self.record("dispatch>update", perf_counter() - start)
+            self.last_change = received
+
+        return timed
+
+    def instrument_device(self, device, name):
+        """
+        Measure how long sending a frame to the device takes
+        """
+        display = device.display
+
+        def timed(image):
+            start = perf_counter()
+            display(image)
+            flush = perf_counter() - start
+            self.record("{} flush".format(name), flush)
+            self.last_flush[name] = flush
+
+        device.display = timed
+
+    def frame(self, name, origin, start, end):
+        """
+        Record a frame rendered between start and end that contains the changes
+        up to origin (called by the RenderWorker). Frames without a new change
+        (meters falling) are not counted, they would only inflate the latency
+        """
+        flush = self.last_flush.pop(name, 0.0)
+        if origin <= self.last_origin.get(name, 0.0):
+            return
+        self.last_origin[name] = origin
+        self.record("{} change>render".format(name), start - origin)
+        self.record("{} draw".format(name), end - start - flush)
+        self.record("{} total".format(name), end - origin)
+
+    def dump(self, file=sys.stdout):
+        print("============ Latency per stage ============", file=file)
+        for stage in sorted(self.histograms):
+            print("{}: {}".format(stage, self.histograms[stage].format()), file=file)
+        print(file=file, flush=True)
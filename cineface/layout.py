@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+
+
+# A single meter bar: horizontal pixel range and the level it shows ("L", "R"
+# or None for mono outputs)
+Bar = namedtuple("Bar", "x0 x1 channel")
+
+# Everything that is drawn for one output besides the level of its bars
+OutputLayout = namedtuple("OutputLayout", "name short bars label mute_rect mute_text")
+
+
+
+
+class LevelLayout():
+    """
+    The positions of everything on the LevelDisplay, compiled once from the
+    configured outputs. Outputs listed in left are placed from the left edge
+    of the display, outputs listed in right from the right edge. Stereo
+    outputs take up two slots, mono outputs one.
+
+    This has no dependency on the display hardware or on PIL: text is measured
+    with the measure function that is passed to compile()
+    """
+
+    def __init__(self, w=128, h=64, slots=9, barwidth=8, margin_bottom=10):
+        self.w = w
+        self.h = h
+        self.slots = slots
+        self.slotwidth = w/slots
+        self.barwidth = barwidth
+        self.gutter = (self.slotwidth-barwidth)/2
+
+        # Bottom of the bars, labels go below
+        self.b = h - margin_bottom
+
+        # Layouts of all placed outputs by name, in config order
+        self.outputs = {}
+
+        # Slot the dB scale labels are centered on (left of the right outputs)
+        self.scale_slot = slots
+
+    def __iter__(self):
+        return iter(self.outputs.values())
+
+    def get(self, name):
+        return self.outputs.get(name)
+
+    def compile(self, outputs, left, right, measure) -> 'LevelLayout':
+        """
+        Place the outputs, given as (name, short, stereo) tuples in config
+        order. measure(text) returns the (width, height) of a label
+        """
+        self.outputs = {}
+
+        n = 0
+        for name, short, stereo in outputs:
+            if name in left:
+                self.outputs[name] = self.place_left(n, name, short, stereo, measure)
+                n += 2 if stereo else 1
+
+        n = 0
+        for name, short, stereo in outputs:
+            if name in right:
+                self.outputs[name] = self.place_right(n, name, short, stereo, measure)
+                n += 2 if stereo else 1
+
+        self.scale_slot = self.slots - n
+        return self
+
+    def place_left(self, x, name, short, stereo, measure) -> OutputLayout:
+        """
+        Place an output at slot x, counted from the left edge
+        """
+        sw, bw, b, h = self.slotwidth, self.barwidth, self.b, self.h
+        w, _ = measure(short)
+
+        if stereo:
+            bars = (
+                Bar(x*sw, x*sw+bw, "L"),
+                Bar((x+1)*sw, (x+1)*sw+bw, "R"),
+            )
+            center = x*sw+sw-self.gutter/2
+            mute_rect = ((x*sw, b+2), (x*sw+sw+bw, h))
+            mute_text = (x*sw+(sw//2), b)
+        else:
+            bars = (Bar(x*sw, x*sw+bw, None),)
+            center = x*sw+bw/2
+            mute_rect = ((x*sw, b+2), (x*sw+bw, h))
+            mute_text = (x*sw, b)
+
+        return OutputLayout(name, short, bars, (center-w/2, b), mute_rect, mute_text)
+
+    def place_right(self, x, name, short, stereo, measure) -> OutputLayout:
+        """
+        Place an output at slot x, counted from the right edge (the right
+        channel of stereo outputs is the outermost one)
+        """
+        sw, bw, b, h, right = self.slotwidth, self.barwidth, self.b, self.h, self.w
+        w, _ = measure(short)
+
+        if stereo:
+            bars = (
+                Bar(right-(x+1)*sw-bw, right-(x+1)*sw, "L"),
+                Bar(right-x*sw-bw, right-x*sw, "R"),
+            )
+            center = right-x*sw-sw+self.gutter
+            mute_rect = ((right-x*sw-sw-bw, b+2), (right-x*sw, h))
+            mute_text = (right-(x*sw+sw+1), b)
+        else:
+            bars = (Bar(right-x*sw-bw, right-x*sw, None),)
+            center = right-x*sw-bw/2
+            mute_rect = ((right-x*sw-bw, b+2), (right-x*sw, h))
+            mute_text = (right-x*sw-bw, b)
+
+        return OutputLayout(name, short, bars, (center-w/2, b), mute_rect, mute_text)
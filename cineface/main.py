@@ -1,96 +1,224 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import asyncio
 import time
-import importlib_metadata
 
-from pythonosc.osc_server import AsyncIOOSCUDPServer
-from pythonosc.dispatcher import Dispatcher
-from pythonosc import osc_message_builder
-from pythonosc import udp_client
-from gpiozero import Button
+# Taken first, so the startup profile includes importing this module
+IMPORT_STARTED = time.perf_counter()
 
-from cineface.config import Config, init_config
-from cineface.helpers import fit, clamp, lerp
-from cineface.totalmix import Output, Outputs
-from cineface.display import VolumeDisplay, LevelDisplay
+import argparse
+import asyncio
+import signal
+import sys
 
+from cineface.osc import OutboundScheduler, register_ping
+from cineface.render import RenderWorker
+from cineface.latency import Latency
+from cineface.bridge import EventBridge
+from cineface.watchdog import Watchdog
 
-VERSION = importlib_metadata.metadata(__package__)["Version"]
-APPLICATION_NAME = importlib_metadata.metadata(__package__)["Name"]
-LICENSE = importlib_metadata.metadata(__package__)["License"]
-AUTHOR = importlib_metadata.metadata(__package__)["Author"]
 
 
 
-# Load configuration
-config = init_config()
+class StartupProfile():
+    """
+    Measures how long every phase of the startup takes, from importing this
+    module to the first frame on a display. Heavy modules (pythonosc, PIL,
+    luma, gpiozero) are only imported in the phase that needs them, so their
+    import time shows up there. Printed when run with --profile-startup
+    """
 
-# Create Outputs Collection
-outputs = Outputs().from_config(config)
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.last    = IMPORT_STARTED
+        self.phases  = []
+        self.phase("import main")
 
-# Create Displays
-volume_display = VolumeDisplay().from_config(config)
-level_display  = LevelDisplay().from_config(config)
-print("============== Setup done ===============\n")
+    def phase(self, name):
+        """
+        End the current phase, it is recorded under the given name
+        """
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
 
+    async def wait_for_first_frame(self, workers):
+        """
+        Record the first frame of any of the workers and print the profile
+        """
+        while not any(worker.frames_rendered for worker in workers):
+            await asyncio.sleep(0.001)
+        self.phase("first frame")
+        self.report()
 
+    def report(self):
+        print("============ Startup profile ============")
+        for name, duration in self.phases:
+            print("{:>20}: {:8.1f} ms".format(name, duration * 1000))
+        print("{:>20}: {:8.1f} ms".format("total", sum(d for _, d in self.phases) * 1000))
+        print()
 
 
 
 
-def update_outputs(addr, value):
+def setup(profile):
+    """
+    Load the configuration and create the outputs and displays
+    """
+    from cineface.config import init_config
+    profile.phase("import config")
+
+    config = init_config()
+    profile.phase("load config")
+
+    from cineface.totalmix import Outputs
+    profile.phase("import totalmix")
+
+    outputs = Outputs().from_config(config)
+    profile.phase("create outputs")
+
+    from cineface.display import VolumeDisplay, LevelDisplay
+    profile.phase("import display")
+
+    volume_display = VolumeDisplay().from_config(config)
+    level_display  = LevelDisplay().from_config(config)
+    profile.phase("create displays")
+
+    # The fader is optional, so is its section in the config. Its position is
+    # sampled by the motor control loop, or on its own without a motor
+    fader = None
+    sampler = None
+    if config.get("Fader", {}).get("active", False):
+        from cineface.fader import MotorFader, VolumeSampler, create_driver
+        driver = create_driver(config["Fader"])
+        sampler = VolumeSampler(driver.read_position).from_config(config)
+        sampler.on_volume = outputs.set_volume
+        if config["Fader"].get("motor", True):
+            fader = MotorFader(driver).from_config(config)
+            fader.register_sampler(sampler)
+            # Shows the outputs the knob sets, not a louder headphone output
+            outputs.add_volume_listener(fader.set_volume)
+        profile.phase("create fader")
+
+    print("============== Setup done ===============\n")
+    return config, outputs, volume_display, level_display, fader, sampler
+
+
+async def drive_display(outputs, worker, snapshot, display, fields, busy=None):
     """
-    Read values received from totalmix and set the value of state to it.
-    Called via Dispatcher Callback. Everything that should react to messages
-    sent to this script via OSC should go here
+    Hand the worker a new snapshot whenever one of the given fields of the
+    outputs changed, but not more often than display.max_fps. Sleeps until the
+    next change otherwise, unless busy() returns True (e.g. because meters are
+    still falling)
     """
-    global outputs
-    global volume_display
+    changed = asyncio.Event()
+    outputs.add_listener(changed.set, fields)
+    last = None
 
-    for output in outputs:
-        if output.is_valid_address(addr):
-            output.update(addr, value)
-            # print(output.as_table())
+    # Draw the initial frame
+    changed.set()
 
+    try:
+        while True:
+            await changed.wait()
+            changed.clear()
 
-async def loop():
+            state = snapshot()
+            if state != last:
+                worker.submit(state)
+                last = state
+
+            # Cap the frame rate, changes during this time are collected (read
+            # every time, it can change when the config is reloaded)
+            await asyncio.sleep(1.0 / display.max_fps)
+            if busy is not None and busy():
+                changed.set()
+    finally:
+        outputs.remove_listener(changed.set)
+
+
+async def loop(outputs, volume_display, level_display, volume_worker, level_worker):
     """
-    Asynchronous Loop reads buttons, faders etc and send messages to totalmix
+    Asynchronous Loop, wakes the displays when the state of the outputs changed.
+    The displays are drawn by their RenderWorkers, this only hands them a
+    snapshot of the current state
     """
-    global outputs
-    global volume_display
-    global level_display
-    frames = 0
+    tasks = []
 
-    while True:
-        # Update & Draw the levels display (if it is activated in the config)
-        volume_display.update(outputs.volume_db, outputs.has_uniform_volume)
-        volume_display.draw()
+    # Update & Draw the volume display (if it is activated in the config)
+    if volume_worker is not None:
+        snapshot = lambda: (outputs.volume_db, outputs.has_uniform_volume, outputs.stale)
+        tasks.append(drive_display(outputs, volume_worker, snapshot, volume_display, ("volume", "mute")))
 
-        # Draw the levels display (if it is activated in the config)
-        level_display.draw(outputs)
+    # Draw the levels display (if it is activated in the config)
+    if level_worker is not None:
+        busy = lambda: not outputs.meters.settled
+        tasks.append(drive_display(outputs, level_worker, outputs.meter_snapshot, level_display, ("level", "mute"), busy))
 
-        frames += 1
-        await asyncio.sleep(0.01)
+    if tasks:
+        await asyncio.gather(*tasks)
+    else:
+        # Nothing to draw, just keep serving
+        await asyncio.get_running_loop().create_future()
 
 
-async def init_main():
+def start_worker(display, latency=None):
     """
-    Asynchronous main, to be called from main()
+    Start a RenderWorker for the display, or return None if it is inactive
     """
-    global config
-    global outputs
+    if display.active:
+        worker = RenderWorker(display)
+        if latency is not None:
+            latency.instrument_device(display.device, worker.name)
+            worker.latency = latency
+        return worker.start()
+    return None
+
+
+async def init_main(config, outputs, volume_display, level_display, fader=None, sampler=None, latency=None, profile=None):
+    """
+    Asynchronous main, to be called from main(). If a Latency is given, every
+    stage from datagram to display is timed. SIGUSR1 prints the button press
+    latency, the outgoing messages (and the histograms)
+    """
+    if profile is None:
+        profile = StartupProfile()
+
+    from pythonosc.osc_server import AsyncIOOSCUDPServer
+    from pythonosc import udp_client
+    from cineface.osc import RoutingDispatcher
+    from cineface.config import get_user_config_path
+    from cineface.reload import ConfigReloader
+    profile.phase("import pythonosc")
 
     print("Setting up dispatcher")
-    dispatcher = Dispatcher()
-    dispatcher.map("/*", update_outputs)
+    dispatcher = RoutingDispatcher()
+    # Every output registers the exact addresses it listens to, so each
+    # incoming message is routed with a single lookup
+    if latency is None:
+        outputs.register_dispatcher(dispatcher)
+    else:
+        outputs.register_dispatcher(dispatcher, latency.wrap_handler)
+        latency.instrument_dispatcher(dispatcher)
+
+    # Button presses are handled on this loop, like the incoming messages
+    bridge = EventBridge()
+    bridge.attach(asyncio.get_running_loop())
+    outputs.register_bridge(bridge)
 
     print("Starting Client for {}:{}".format(config["Client"]["ip"], config["Client"]["port"]))
     client = udp_client.SimpleUDPClient(config["Client"]["ip"], config["Client"]["port"])
-    client.send_message("/setBankStart", 1.0)
-    client.send_message("/1/busOutput", 1.0)
     outputs.register_client(client)
+    outputs.select_bank()
+
+    # Coalesce continuous volume changes before they are sent
+    scheduler = OutboundScheduler(outputs.send_batch, config["Client"].get("max_rate", 50.0))
+    outputs.register_scheduler(scheduler)
+    scheduler_task = asyncio.ensure_future(scheduler.run())
+
+    # Resync when TotalMix comes back after it went silent (or restarted)
+    watchdog = Watchdog(outputs, config["Server"].get("watchdog_timeout", 2.0))
+    watchdog.watch(dispatcher)
+    watchdog_task = asyncio.ensure_future(watchdog.run())
 
     print("Starting Server at {}:{}".format(config["Server"]["ip"], config["Server"]["port"]))
     server = AsyncIOOSCUDPServer((config["Server"]["ip"], config["Server"]["port"]), dispatcher, asyncio.get_event_loop())
@@ -98,18 +226,78 @@ async def init_main():
     # Create datagram endpoint and start serving
     transport, protocol = await server.create_serve_endpoint()
 
-    print("Listening...")
-    await loop()
+    # Answer pings (e.g. from the simulator) to make the round trip through
+    # the event loop measurable
+    register_ping(dispatcher, transport)
+    profile.phase("start server")
+
+    if fader is not None:
+        print("Starting motor fader control loop at {:g} Hz".format(fader.rate))
+        fader.start()
+    elif sampler is not None:
+        print("Sampling the fader at {:g} Hz".format(sampler.rate))
+        sampler.start()
+
+    print("Starting render workers")
+    volume_worker = start_worker(volume_display, latency)
+    level_worker = start_worker(level_display, latency)
+    workers = [worker for worker in (volume_worker, level_worker) if worker is not None]
+    if profile.enabled and workers:
+        asyncio.ensure_future(profile.wait_for_first_frame(workers))
+
+    # Apply changes to the config file while running
+    reloader = ConfigReloader(get_user_config_path(), config, outputs, volume_display, level_display)
+    reloader.register_workers(volume_worker, level_worker)
+    reloader_task = asyncio.ensure_future(reloader.run())
+
+    def dump_stats():
+        print("Buttons: {}".format(bridge.stats()))
+        print("Outgoing: {}, bank {}".format(scheduler.stats(), outputs.session.stats()))
+        for worker in workers:
+            print("{}: {}".format(worker.name, worker.stats()))
+        sys.stdout.flush()
+        if latency is not None:
+            latency.dump()
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, dump_stats)
 
-    transport.close()
+    print("Listening...")
+    try:
+        await loop(outputs, volume_display, level_display, volume_worker, level_worker)
+    finally:
+        bridge.detach()
+        scheduler_task.cancel()
+        watchdog_task.cancel()
+        reloader_task.cancel()
+        scheduler.flush()
+        for worker in workers:
+            worker.stop()
+        if fader is not None:
+            fader.stop()
+            print("Motor fader: {}".format(fader.stats()))
+        elif sampler is not None:
+            sampler.stop()
+            print("Fader sampling: {}".format(sampler.stats()))
+        if sampler is not None:
+            print("Fader: {}".format(sampler.reduction()))
+        transport.close()
+        dump_stats()
 
 
 def main():
     """
     Entry point, run this to run the programme
     """
-    
-    asyncio.run(init_main())
+    parser = argparse.ArgumentParser(description="Control RME TotalMix outputs with buttons and displays")
+    parser.add_argument("--latency", action="store_true", help="time every stage from datagram to display (print with kill -USR1)")
+    parser.add_argument("--profile-startup", action="store_true", help="print how long every phase of the startup took")
+    args = parser.parse_args()
+
+    profile = StartupProfile(args.profile_startup)
+    config, outputs, volume_display, level_display, fader, sampler = setup(profile)
+    latency = Latency() if args.latency else None
+
+    asyncio.run(init_main(config, outputs, volume_display, level_display, fader, sampler, latency, profile))
 
 
 if __name__ == "__main__":
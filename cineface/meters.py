@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+from array import array
+
+
+# Differences below this are treated as settled (a fraction of a pixel)
+EPSILON = 1e-4
+
+
+def coefficient(dt: float, time_constant: float) -> float:
+    """
+    How far an exponential movement with the given time constant gets in dt
+    seconds (1.0 means it arrives immediately)
+    """
+    if time_constant <= 0.0:
+        return 1.0
+    return 1.0 - math.exp(-dt / time_constant)
+
+
+
+
+class MeterBallistics():
+    """
+    Meter ballistics for all level channels at once: the raw levels received
+    from TotalMix are the targets, the displayed values rise towards them with
+    the attack time constant and fall with the release time constant (both in
+    seconds). A peak marker stays at the highest value for hold seconds and
+    then falls back with the release time.
+
+    All channels live in contiguous arrays and are advanced together by step(),
+    which is called once per frame. The movement only depends on the time
+    between frames, not on how often TotalMix sends levels.
+    """
+
+    def __init__(self, attack=0.0, release=0.3, hold=1.0):
+        self.attack  = attack
+        self.release = release
+        self.hold    = hold
+
+        self.target    = array("d")
+        self.value     = array("d")
+        self.peak      = array("d")
+        self.peak_time = array("d")
+
+        self.last_step = None
+
+        # True if no channel is moving or holding a peak
+        self.settled = True
+
+    def from_config(self, config) -> 'MeterBallistics':
+        self.attack  = config["LevelDisplay"].get("attack", self.attack)
+        self.release = config["LevelDisplay"].get("release", self.release)
+        self.hold    = config["LevelDisplay"].get("peak_hold", self.hold)
+        return self
+
+    def __len__(self):
+        return len(self.target)
+
+    @property
+    def has_peaks(self) -> bool:
+        return self.hold > 0.0
+
+    def add_channel(self) -> int:
+        """
+        Add a channel and return its index
+        """
+        for column in (self.target, self.value, self.peak, self.peak_time):
+            column.append(0.0)
+        return len(self.target) - 1
+
+    def clear_channel(self, channel: int):
+        """
+        Reset a channel to silence (e.g. when it is reused)
+        """
+        for column in (self.target, self.value, self.peak, self.peak_time):
+            column[channel] = 0.0
+
+    def set(self, channel: int, value: float):
+        """
+        Set the raw level of a channel
+        """
+        self.target[channel] = value
+        self.settled = False
+
+    def step(self, now: float):
+        """
+        Advance all channels to the time now (in seconds, e.g. time.monotonic())
+        """
+        if self.last_step is None:
+            dt = 0.0
+        else:
+            dt = now - self.last_step
+        self.last_step = now
+
+        attack  = coefficient(dt, self.attack)
+        release = coefficient(dt, self.release)
+        hold    = self.hold
+        target, values, peaks, peak_times = self.target, self.value, self.peak, self.peak_time
+
+        settled = True
+        for i in range(len(target)):
+            goal  = target[i]
+            value = values[i]
+
+            if goal > value:
+                value += (goal - value) * attack
+            else:
+                value += (goal - value) * release
+
+            if abs(goal - value) < EPSILON:
+                value = goal
+            else:
+                settled = False
+            values[i] = value
+
+            # Peak hold
+            peak = peaks[i]
+            if value >= peak or hold <= 0.0:
+                peaks[i] = value
+                peak_times[i] = now
+            elif now - peak_times[i] < hold:
+                settled = False
+            else:
+                peak += (value - peak) * release
+                if abs(peak - value) < EPSILON:
+                    peak = value
+                else:
+                    settled = False
+                peaks[i] = peak
+
+        self.settled = settled
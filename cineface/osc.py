@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+from functools import lru_cache
+
+
+# Characters that turn an OSC address into an address pattern
+OSC_PATTERN_CHARS = frozenset("*?[]{}")
+
+# The busses of the first TotalMix layer, only one of them is selected
+TOTALMIX_BUSSES = ["/1/busInput", "/1/busPlayback", "/1/busOutput"]
+
+# A ping received on this address is answered on the pong address (with the
+# same argument), used to measure the round trip through the event loop
+PING_ADDRESS = "/cineface/ping"
+PONG_ADDRESS = "/cineface/pong"
+
+
+@lru_cache(maxsize=None)
+def routing_dispatcher() -> type:
+    """
+    Define the RoutingDispatcher class on first use: it derives from the
+    pythonosc Dispatcher, which is slow to import
+    """
+    from pythonosc.dispatcher import Dispatcher
+
+    class RoutingDispatcher(Dispatcher):
+        """
+        A pythonosc Dispatcher that resolves exact addresses with a single dict
+        lookup. The stock Dispatcher compiles a regex for every incoming message
+        and matches it against every mapped address, which gets expensive once
+        TotalMix streams meter levels at a couple hundred messages per second.
+
+        Wildcard mappings (e.g. "/*") and incoming address patterns still work,
+        they just fall back to the (slower) matching of the parent class.
+        """
+
+        def __init__(self):
+            super().__init__()
+            # Number of mapped addresses that contain pattern characters
+            self._n_patterns = 0
+
+        def map(self, address, handler, *args, needs_reply_address=False):
+            if not OSC_PATTERN_CHARS.isdisjoint(address):
+                self._n_patterns += 1
+            return super().map(address, handler, *args, needs_reply_address=needs_reply_address)
+
+        def unmap(self, address, handler, *args, needs_reply_address=False):
+            super().unmap(address, handler, *args, needs_reply_address=needs_reply_address)
+            if not OSC_PATTERN_CHARS.isdisjoint(address):
+                self._n_patterns -= 1
+
+        def handlers_for_address(self, address_pattern):
+            # Only plain addresses can be resolved by lookup, and only if there are
+            # no wildcard mappings that could match them as well
+            if self._n_patterns > 0 or not OSC_PATTERN_CHARS.isdisjoint(address_pattern):
+                return super().handlers_for_address(address_pattern)
+
+            handlers = self._map.get(address_pattern)
+            if handlers:
+                return handlers
+            elif self._default_handler is not None:
+                return [self._default_handler]
+            else:
+                return []
+
+    return RoutingDispatcher
+
+
+def __getattr__(name):
+    if name == "RoutingDispatcher":
+        return routing_dispatcher()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def register_ping(dispatcher, transport):
+    """
+    Answer pings received by the dispatcher with a pong, sent back to where
+    the ping came from through the transport of the server
+    """
+    def pong(client_address, addr, value):
+        transport.sendto(build_message(PONG_ADDRESS, value), client_address)
+
+    dispatcher.map(PING_ADDRESS, pong, needs_reply_address=True)
+
+
+def build_message(address, value) -> bytes:
+    """
+    Build the datagram of a single OSC message
+    """
+    from pythonosc import osc_message_builder
+    message = osc_message_builder.OscMessageBuilder(address=address)
+    message.add_arg(value)
+    return message.build().dgram
+
+
+def build_bundle(messages):
+    """
+    Build a single OSC bundle (to be executed immediately) from a list of
+    (address, value) messages
+    """
+    from pythonosc import osc_bundle_builder, osc_message_builder
+    bundle = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+    for address, value in messages:
+        message = osc_message_builder.OscMessageBuilder(address=address)
+        message.add_arg(value)
+        bundle.add_content(message.build())
+    return bundle.build()
+
+
+
+class BankSession():
+    """
+    Keeps track of the bank and bus TotalMix currently has selected, so the
+    selection messages only need to be sent when TotalMix doesn't have the
+    wanted ones selected already.
+
+    The selection is assumed once it was sent and confirmed or revoked by what
+    TotalMix echoes back: if someone selects another bus in the TotalMix UI
+    (or another bank start is reported), the next command selects ours again.
+    Call invalidate() if TotalMix was restarted.
+    """
+
+    def __init__(self, bank=1.0, bus="/1/busOutput"):
+        self.bank = bank
+        self.bus  = bus
+
+        # Whether TotalMix has our bank and bus selected (as far as we know)
+        self.selected = False
+
+        # Count how often a selection was needed and how often it was skipped
+        self.selections_sent    = 0
+        self.selections_skipped = 0
+
+    @property
+    def messages(self):
+        """
+        The (address, value) messages that select our bank and bus
+        """
+        return [("/setBankStart", self.bank), (self.bus, 1.0)]
+
+    def selection(self):
+        """
+        Return the messages that need to be sent before a command (nothing if
+        the bank and bus are selected already). Assumes they will be sent
+        """
+        if self.selected:
+            self.selections_skipped += 1
+            return []
+        self.selected = True
+        self.selections_sent += 1
+        return self.messages
+
+    def invalidate(self):
+        """
+        Forget the selection, the next command will send it again
+        """
+        self.selected = False
+
+    def stats(self) -> str:
+        return "{} selections sent, {} skipped".format(self.selections_sent, self.selections_skipped)
+
+    def routes(self) -> dict:
+        """
+        The addresses TotalMix uses to report the selection, mapped to handlers
+        """
+        routes = {bus: self.update_bus for bus in TOTALMIX_BUSSES}
+        routes["/setBankStart"] = self.update_bank
+        return routes
+
+    def update_bus(self, addr, value):
+        if addr == self.bus:
+            self.selected = value == 1.0
+        elif value == 1.0:
+            # Another bus was selected in TotalMix
+            self.selected = False
+
+    def update_bank(self, addr, value):
+        if value != self.bank:
+            self.selected = False
+
+
+
+
+class OutboundScheduler():
+    """
+    Coalesces continuous changes (e.g. from a potentiometer) before they are
+    sent to TotalMix, which starts to lag when it is flooded with messages.
+
+    Only the latest value per OSC address is kept. The first change is sent
+    right away, changes that follow are collected and sent at most rate times
+    per second, so the final value always goes out when the movement stops.
+    put() can be called from any thread, the sending happens in run() on the
+    event loop. send is called with a list of (address, value) messages.
+    """
+
+    def __init__(self, send, rate=50.0):
+        self.send     = send
+        self.interval = 1.0 / rate
+
+        self.lock    = threading.Lock()
+        self.pending = {}
+        self.loop    = None
+        self.wakeup  = None
+
+        # Messages put into the scheduler, messages sent and messages that
+        # were replaced by a newer value before they could be sent
+        self.generated = 0
+        self.sent      = 0
+        self.coalesced = 0
+
+    def put(self, address, value):
+        """
+        Schedule a message, replacing a pending message to the same address
+        """
+        with self.lock:
+            self.generated += 1
+            if address in self.pending:
+                self.coalesced += 1
+            was_idle = not self.pending
+            self.pending[address] = value
+
+        if was_idle and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def send_now(self, address, value):
+        """
+        Send a discrete command (e.g. a mute) right away, together with the
+        pending changes. Must be called on the event loop, like run()
+        """
+        self.send_all([(address, value)])
+
+    def send_all(self, messages):
+        """
+        Send (address, value) commands right away in one go with the pending
+        changes. They replace pending changes to the same addresses, so an
+        older change can't undo them afterwards. Must be called on the event
+        loop, like run()
+        """
+        with self.lock:
+            for address, value in messages:
+                self.generated += 1
+                if address in self.pending:
+                    self.coalesced += 1
+                self.pending[address] = value
+        self.flush()
+
+    def flush(self):
+        """
+        Send all pending messages now
+        """
+        with self.lock:
+            messages = list(self.pending.items())
+            self.pending.clear()
+        if messages:
+            self.send(messages)
+            self.sent += len(messages)
+
+    async def run(self):
+        # put() uses the wakeup once the loop is set, so create it first
+        self.wakeup = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        if self.pending:
+            self.wakeup.set()
+
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            self.flush()
+
+            # Changes during this time are collected, wake up once more
+            # afterwards to send them
+            await asyncio.sleep(self.interval)
+            if self.pending:
+                self.wakeup.set()
+
+    def stats(self) -> str:
+        return "{} messages generated, {} sent, {} coalesced".format(
+            self.generated, self.sent, self.coalesced)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import sys
+import traceback
+
+from cineface.config import load_config
+
+
+# Settings that need new hardware or sockets, changing them needs a restart
+RESTART_SECTIONS = ["Client", "Server", "Fader"]
+RESTART_KEYS = ["active", "backend", "png_dir", "i2c_port", "i2c_address"]
+
+# Settings of the meter ballistics (in the [LevelDisplay] section)
+METER_KEYS = ["attack", "release", "peak_hold"]
+
+# Fields of an [[Output]] the LevelDisplay layout depends on
+LAYOUT_KEYS = ["name", "short", "stereo"]
+
+
+
+
+def changed_keys(old, new):
+    """
+    Return the keys whose values differ between two config sections
+    """
+    return {key for key in set(old) | set(new) if old.get(key) != new.get(key)}
+
+
+
+
+class ConfigReloader():
+    """
+    Watches the config file and applies changes while cineface keeps running,
+    rebuilding only what a change affects:
+
+        [[Output]]        the changed Output (with its GPIO button and LED)
+        [LevelDisplay]    the scale and layout, the meter ballistics
+        [VolumeDisplay]   the font and the frame cache
+
+    The file is polled for a new modification time every interval seconds
+    (one stat() call). A changed file that can't be parsed or misses fields
+    is reported and the running config is kept. Changes that need new
+    hardware or sockets ([Client], [Server], [Fader], active/backend/i2c
+    settings of the displays, adding or removing outputs) are reported as
+    needing a restart.
+
+    The displays are reconfigured on their RenderWorker threads (if they have
+    one), so they never change in the middle of a frame
+    """
+
+    def __init__(self, path, config, outputs, volume_display, level_display, interval=1.0):
+        self.path     = path
+        self.config   = config
+        self.outputs  = outputs
+        self.interval = interval
+
+        self.volume_display = volume_display
+        self.level_display  = level_display
+        self.volume_worker  = None
+        self.level_worker   = None
+
+        self.mtime = self.stat()
+
+        # Number of reloads that were applied
+        self.reloads = 0
+
+    def register_workers(self, volume_worker, level_worker):
+        self.volume_worker = volume_worker
+        self.level_worker  = level_worker
+
+    def stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def check(self) -> bool:
+        """
+        Reload the config if the file changed, returns True if it was applied
+        """
+        mtime = self.stat()
+        if mtime is None or mtime == self.mtime:
+            return False
+        self.mtime = mtime
+
+        try:
+            config = load_config(self.path)
+            if config is None:
+                print("Keeping the running configuration")
+                return False
+
+            self.apply(config)
+        except Exception:
+            # The task has to survive, the next change of the file is tried again
+            print("Error: applying the changed configuration failed, keeping the running one:", file=sys.stderr)
+            traceback.print_exc()
+            return False
+        return True
+
+    def reconfigure(self, display, worker, config):
+        if not display.active:
+            return
+        if worker is None:
+            display.configure(config)
+        else:
+            worker.call(lambda: display.configure(config))
+
+    def apply(self, config):
+        """
+        Apply the differences between the running config and the given one
+        """
+        old = self.config
+        restart = []
+
+        for section in RESTART_SECTIONS:
+            if old.get(section) != config.get(section):
+                restart.append("[{}]".format(section))
+        for section in ("VolumeDisplay", "LevelDisplay"):
+            for key in changed_keys(old[section], config[section]) & set(RESTART_KEYS):
+                restart.append("{} in [{}]".format(key, section))
+
+        # Outputs are replaced one by one, the layout only needs to be compiled
+        # again if something it shows changed
+        layout_changed = False
+        if len(old["Output"]) != len(config["Output"]):
+            restart.append("the number of [[Output]]s")
+        else:
+            for index, (before, after) in enumerate(zip(old["Output"], config["Output"])):
+                keys = changed_keys(before, after)
+                if keys:
+                    print("Reloading output \"{}\"".format(after["name"]))
+                    self.outputs.replace_output(index, after)
+                    layout_changed = layout_changed or bool(keys & set(LAYOUT_KEYS))
+
+        level_keys = changed_keys(old["LevelDisplay"], config["LevelDisplay"]) - set(RESTART_KEYS)
+        if level_keys & set(METER_KEYS):
+            self.outputs.meters.from_config(config)
+        if layout_changed or level_keys - set(METER_KEYS):
+            print("Reloading LevelDisplay")
+            self.reconfigure(self.level_display, self.level_worker, config)
+
+        if changed_keys(old["VolumeDisplay"], config["VolumeDisplay"]) - set(RESTART_KEYS):
+            print("Reloading VolumeDisplay")
+            self.reconfigure(self.volume_display, self.volume_worker, config)
+
+        if restart:
+            print("Restart cineface to apply changes to {}".format(", ".join(restart)))
+
+        self.config = config
+        self.reloads += 1
+        self.outputs.notify()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.check()
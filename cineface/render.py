@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+import traceback
+from time import perf_counter
+
+
+
+
+class RenderWorker():
+    """
+    Renders frames for a single display on a dedicated thread, so that PIL
+    drawing and (blocking) I2C transfers never hold up the asyncio event loop
+    that receives the OSC messages.
+
+    The event loop submits immutable snapshots of the state it wants to see on
+    the display. Only the newest snapshot is kept: if a new one arrives while a
+    frame is still being drawn, it replaces the pending one. So there is never
+    more than one frame in flight and one waiting per display, no matter how
+    slow the bus is.
+
+    Anything that changes the display itself (e.g. a reloaded config) is
+    handed over with call(), so it runs on the render thread between frames
+    and the display never has to be locked.
+    """
+
+    def __init__(self, display, name=None):
+        # Anything with a render(snapshot) method
+        self.display = display
+        self.name    = name or type(display).__name__
+
+        self.condition = threading.Condition()
+        self.pending   = None
+        self.calls     = []
+        self.running   = False
+        self.thread    = None
+
+        # Count rendered frames and snapshots that were replaced before they
+        # could be rendered
+        self.frames_rendered = 0
+        self.frames_dropped  = 0
+
+        # Optional cineface.latency.Latency, None unless instrumentation is on
+        self.latency        = None
+        self.pending_origin = 0.0
+
+        # The last snapshot that was rendered, drawn again after a call()
+        self.last_snapshot = None
+
+    def start(self) -> 'RenderWorker':
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+    def stats(self) -> str:
+        """
+        The frames of this worker, plus the stats of the display and the
+        traffic of its device where they keep any (e.g. a DiffSH1106)
+        """
+        parts = ["{} snapshots rendered, {} dropped".format(self.frames_rendered, self.frames_dropped)]
+        if hasattr(self.display, "stats"):
+            parts.append(self.display.stats())
+        device = getattr(self.display, "device", None)
+        if hasattr(device, "bytes_sent"):
+            parts.append("{} bytes sent, {} in the last frame".format(device.bytes_sent, device.last_frame_bytes))
+        return ", ".join(parts)
+
+    def submit(self, snapshot):
+        """
+        Hand a new snapshot to the worker (called from the event loop, never
+        blocks for longer than it takes to swap the pending snapshot)
+        """
+        with self.condition:
+            if self.pending is not None:
+                self.frames_dropped += 1
+            self.pending = snapshot
+            if self.latency is not None:
+                self.pending_origin = self.latency.last_change
+            self.condition.notify()
+
+    def call(self, function):
+        """
+        Run function (without arguments) on the render thread before the next
+        frame, the last snapshot is rendered again afterwards
+        """
+        with self.condition:
+            self.calls.append(function)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending is None and not self.calls:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                calls, self.calls = self.calls, []
+                snapshot = self.pending
+                self.pending = None
+                origin = self.pending_origin
+
+            for function in calls:
+                try:
+                    function()
+                except Exception:
+                    print("Error: reconfiguring {} failed:".format(self.name), file=sys.stderr)
+                    traceback.print_exc()
+
+            if snapshot is None:
+                snapshot = self.last_snapshot
+                if snapshot is None:
+                    continue
+
+            try:
+                if self.latency is None:
+                    self.display.render(snapshot)
+                else:
+                    start = perf_counter()
+                    self.display.render(snapshot)
+                    self.latency.frame(self.name, origin, start, perf_counter())
+                self.frames_rendered += 1
+                self.last_snapshot = snapshot
+            except Exception:
+                # A broken frame should not take the display down for good
+                print("Error: rendering a frame for {} failed:".format(self.name), file=sys.stderr)
+                traceback.print_exc()
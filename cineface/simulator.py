@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A stand-in for RME TotalMix that speaks the OSC addresses cineface uses, to
+test cineface under realistic (and unrealistic) message rates without an
+audio interface. Start cineface with its [Client] pointing at the simulator
+and run e.g.:
+
+    python -m cineface.simulator --target-port 9001 --listen-port 7001 --rate 30 --ramp
+
+The simulator streams meter levels for all channels, answers bank/bus
+selection with a full state dump and echoes volume and mute commands like
+TotalMix does. Every few seconds it reports how much it sent, how many
+datagrams the receiving socket dropped and the event loop round trip: pings
+sent to cineface's server socket, queued behind the meter stream and
+answered by its event loop (this is not the echo of a mixer command).
+"""
+import argparse
+import asyncio
+import math
+import time
+
+from pythonosc import udp_client
+from pythonosc.osc_server import AsyncIOOSCUDPServer
+
+from cineface.curve import fader_to_db
+from cineface.latency import percentile
+from cineface.osc import RoutingDispatcher, TOTALMIX_BUSSES, PING_ADDRESS, PONG_ADDRESS, build_bundle, build_message
+
+
+# Pings that are not answered within this many seconds count as lost
+PING_TIMEOUT = 1.0
+
+
+
+
+def udp_socket_stats(port: int):
+    """
+    Return (drops, rx_queue) of the UDP socket bound to the given local port,
+    read from /proc/net/udp (Linux only, the socket has to be on this host).
+    Returns None if the socket can't be found
+    """
+    for path in ("/proc/net/udp", "/proc/net/udp6"):
+        try:
+            with open(path) as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            local_port = int(fields[1].rsplit(":", 1)[1], 16)
+            if local_port == port:
+                rx_queue = int(fields[4].split(":")[1], 16)
+                return int(fields[-1]), rx_queue
+    return None
+
+
+
+
+class TotalMixSimulator():
+    """
+    Simulates the output bus of TotalMix with a number of channels
+    """
+
+    def __init__(self, target_ip, target_port, channels=8, rate=30.0, bundle=False):
+        self.target      = (target_ip, target_port)
+        self.target_port = target_port
+        self.client   = udp_client.SimpleUDPClient(target_ip, target_port)
+        self.channels = channels
+        self.bundle   = bundle
+
+        # Level frames (all level messages of all channels) per second
+        self.rate = rate
+
+        # Mixer state
+        self.volume = [0.817] * channels
+        self.mute   = [False] * channels
+        self.bank   = 1.0
+        self.bus    = "/1/busOutput"
+
+        # Statistics
+        self.messages_sent = 0
+        self.send_errors   = 0
+        self.commands      = 0
+        self.pings         = {}
+        self.ping_seq      = 0
+        self.round_trips   = []
+        self.pings_lost    = 0
+
+        # Transport of the socket commands are received on, see serve()
+        self.transport = None
+
+    async def serve(self, listen_ip, listen_port):
+        """
+        Receive commands (and pongs) on the given address
+        """
+        server = AsyncIOOSCUDPServer((listen_ip, listen_port), self.dispatcher(), asyncio.get_running_loop())
+        self.transport, protocol = await server.create_serve_endpoint()
+        return self.transport
+
+    def send(self, messages):
+        """
+        Send (address, value) messages, as a bundle or one datagram each
+        """
+        try:
+            if self.bundle:
+                self.client.send(build_bundle(messages))
+            else:
+                for address, value in messages:
+                    self.client.send_message(address, value)
+            self.messages_sent += len(messages)
+        except (BlockingIOError, OSError):
+            self.send_errors += 1
+
+    def channel_messages(self, n):
+        """
+        The volume, display value and mute messages of channel n (1-based)
+        """
+        volume = self.volume[n-1]
+        return [
+            ("/1/volume{}".format(n), volume),
+            ("/1/volume{}Val".format(n), "{:.1f}".format(fader_to_db(volume))),
+            ("/1/mute/1/{}".format(n), 1.0 if self.mute[n-1] else 0.0),
+        ]
+
+    def dump_state(self):
+        """
+        Send the complete state, like TotalMix does after a bus selection
+        """
+        messages = [(bus, 1.0 if bus == self.bus else 0.0) for bus in TOTALMIX_BUSSES]
+        for n in range(1, self.channels + 1):
+            messages.extend(self.channel_messages(n))
+        self.send(messages)
+
+    def level_messages(self, t):
+        messages = []
+        for n in range(1, self.channels + 1):
+            for side in ("Left", "Right"):
+                level = 0.45 + 0.35 * math.sin(t * (2.0 + n + (side == "Right"))) * math.sin(t * 0.5 + n)
+                messages.append(("/1/level{}{}".format(n, side), max(0.0, level)))
+        return messages
+
+    def dispatcher(self) -> RoutingDispatcher:
+        dispatcher = RoutingDispatcher()
+        for n in range(1, self.channels + 1):
+            dispatcher.map("/1/volume{}".format(n), self.on_volume, n)
+            dispatcher.map("/1/mute/1/{}".format(n), self.on_mute, n)
+        for bus in TOTALMIX_BUSSES:
+            dispatcher.map(bus, self.on_bus)
+        dispatcher.map("/setBankStart", self.on_bank)
+        dispatcher.map(PONG_ADDRESS, self.on_pong)
+        return dispatcher
+
+    def on_volume(self, addr, args, value):
+        self.commands += 1
+        n = args[0]
+        self.volume[n-1] = min(1.0, max(0.0, value))
+        self.send(self.channel_messages(n)[:2])
+
+    def on_mute(self, addr, args, value):
+        self.commands += 1
+        n = args[0]
+        self.mute[n-1] = value == 1.0
+        self.send(self.channel_messages(n)[2:])
+
+    def on_bus(self, addr, value):
+        self.commands += 1
+        if value == 1.0:
+            self.bus = addr
+            self.dump_state()
+
+    def on_bank(self, addr, value):
+        self.commands += 1
+        self.bank = value
+
+    def on_pong(self, addr, seq):
+        sent = self.pings.pop(int(seq), None)
+        if sent is not None:
+            self.round_trips.append(time.perf_counter() - sent)
+
+    async def stream_levels(self):
+        """
+        Send level frames at self.rate, catching up (up to a limit) if the
+        event loop fell behind
+        """
+        start = time.perf_counter()
+        next_frame = start
+        while True:
+            now = time.perf_counter()
+            frames = 0
+            while next_frame <= now and frames < 10:
+                self.send(self.level_messages(next_frame - start))
+                next_frame += 1.0 / self.rate
+                frames += 1
+            if next_frame <= now:
+                # Too far behind, skip the missed frames
+                next_frame = now
+            await asyncio.sleep(max(0.0, next_frame - time.perf_counter()))
+
+    def send_ping(self):
+        """
+        Send a ping from the socket that receives the pong (cineface answers
+        to the source address)
+        """
+        self.ping_seq += 1
+        self.pings[self.ping_seq] = time.perf_counter()
+        try:
+            self.transport.sendto(build_message(PING_ADDRESS, self.ping_seq), self.target)
+        except OSError:
+            self.send_errors += 1
+
+    async def send_pings(self, rate):
+        while True:
+            self.send_ping()
+
+            # Forget pings that didn't come back
+            deadline = time.perf_counter() - PING_TIMEOUT
+            for seq in [seq for seq, sent in self.pings.items() if sent < deadline]:
+                del self.pings[seq]
+                self.pings_lost += 1
+
+            await asyncio.sleep(1.0 / rate)
+
+    async def ramp(self, step, factor, max_rate):
+        """
+        Multiply the level rate by factor every step seconds until max_rate
+        """
+        while self.rate * factor <= max_rate:
+            await asyncio.sleep(step)
+            self.rate *= factor
+
+    async def report(self, interval):
+        last_sent = 0
+        last_drops = None
+        while True:
+            await asyncio.sleep(interval)
+            sent = self.messages_sent - last_sent
+            last_sent = self.messages_sent
+
+            socket_stats = udp_socket_stats(self.target_port)
+            if socket_stats is None:
+                drops = "drops n.a."
+            else:
+                total, rx_queue = socket_stats
+                new = 0 if last_drops is None else total - last_drops
+                last_drops = total
+                drops = "drops {} (+{}), rx queue {} B".format(total, new, rx_queue)
+
+            if self.round_trips:
+                rtt = "loop rtt p50 {:.2f} ms p99 {:.2f} ms".format(
+                    percentile(self.round_trips, 50) * 1000,
+                    percentile(self.round_trips, 99) * 1000)
+            else:
+                rtt = "loop rtt n.a."
+            self.round_trips = []
+
+            print("{:7.1f} frames/s | {:8.0f} msgs/s | {} commands | {} | {} pings lost | {} | {} send errors".format(
+                self.rate, sent / interval, self.commands, rtt, self.pings_lost, drops, self.send_errors))
+
+
+
+
+async def run(args):
+    simulator = TotalMixSimulator(args.target_ip, args.target_port, args.channels, args.rate, args.bundle)
+    transport = await simulator.serve(args.listen_ip, args.listen_port)
+    print("Simulating TotalMix on {}:{}, sending to {}:{}".format(args.listen_ip, args.listen_port, args.target_ip, args.target_port))
+
+    simulator.dump_state()
+    tasks = [
+        simulator.stream_levels(),
+        simulator.send_pings(args.ping_rate),
+        simulator.report(args.interval),
+    ]
+    if args.ramp:
+        tasks.append(simulator.ramp(args.step, 2.0, args.max_rate))
+
+    try:
+        if args.duration:
+            await asyncio.wait_for(asyncio.gather(*tasks), args.duration)
+        else:
+            await asyncio.gather(*tasks)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate RME TotalMix for cineface")
+    parser.add_argument("--listen-ip", default="0.0.0.0", help="address to receive commands on")
+    parser.add_argument("--listen-port", type=int, default=7001, help="port to receive commands on ([Client] port of cineface)")
+    parser.add_argument("--target-ip", default="127.0.0.1", help="address of cineface")
+    parser.add_argument("--target-port", type=int, default=9001, help="port of cineface ([Server] port)")
+    parser.add_argument("--channels", type=int, default=8, help="number of output channels")
+    parser.add_argument("--rate", type=float, default=30.0, help="level frames per second (all channels)")
+    parser.add_argument("--bundle", action="store_true", help="send each frame as one OSC bundle")
+    parser.add_argument("--ramp", action="store_true", help="double the rate every --step seconds")
+    parser.add_argument("--step", type=float, default=10.0, help="seconds between rate steps")
+    parser.add_argument("--max-rate", type=float, default=2000.0, help="highest rate to ramp up to")
+    parser.add_argument("--ping-rate", type=float, default=10.0, help="event loop round trip probes per second")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between reports")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
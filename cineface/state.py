@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from array import array
+from collections import namedtuple
+
+
+# Marks unknown values in the float columns (NaN is the only value that isn't
+# equal to itself)
+UNKNOWN = float("nan")
+
+# Marks an unknown mute state in the mute column
+UNKNOWN_MUTE = -1
+
+# Fields change events are published for (see MixerState.subscribe)
+FIELDS = ("volume", "mute", "level")
+
+
+def known(value):
+    """
+    Convert a value read from a float column into None if it is unknown
+    """
+    if value != value:
+        return None
+    return value
+
+
+
+
+class MixerState():
+    """
+    The state of all mixer channels in one columnar store: every column is a
+    contiguous array indexed by channel. Unknown values (nothing received from
+    TotalMix yet) are stored as NaN or UNKNOWN_MUTE, accessors return them as
+    None.
+
+    Outputs and their levels are thin views onto one channel of this store, so
+    aggregates over all channels are simple passes over the columns.
+
+    TotalMix sends unchanged values all the time. The setters compare every
+    value with the stored one and only publish a change event if it differs,
+    to the subscribers of that field (see subscribe). They return whether the
+    value changed
+    """
+
+    def __init__(self):
+        self.volume  = array("d")
+        self.mute    = array("b")
+        self.level_l = array("d")
+        self.level_r = array("d")
+
+        # Subscribers per (field, channel), channel None for all channels
+        self.subscribers = {}
+
+    def __len__(self):
+        return len(self.volume)
+
+    def add_channel(self) -> int:
+        """
+        Add a channel with unknown values and return its index
+        """
+        self.volume.append(UNKNOWN)
+        self.mute.append(UNKNOWN_MUTE)
+        self.level_l.append(UNKNOWN)
+        self.level_r.append(UNKNOWN)
+        return len(self.volume) - 1
+
+    def subscribe(self, field, subscriber, channel=None):
+        """
+        Call subscriber(channel, value) whenever the field ("volume", "mute" or
+        "level") of the given channel (or of any channel) changed
+        """
+        if field not in FIELDS:
+            raise KeyError(field)
+        self.subscribers.setdefault((field, channel), []).append(subscriber)
+
+    def unsubscribe(self, field, subscriber, channel=None):
+        subscribers = self.subscribers.get((field, channel), [])
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+
+    def publish(self, field, channel, value):
+        for subscriber in self.subscribers.get((field, channel), ()):
+            subscriber(channel, value)
+        for subscriber in self.subscribers.get((field, None), ()):
+            subscriber(channel, value)
+
+    def clear_channel(self, channel: int):
+        """
+        Make all values of a channel unknown again (e.g. when it is reused)
+        """
+        self.set_volume(channel, None)
+        self.set_mute(channel, None)
+        self.set_level(channel, "L", None)
+        self.set_level(channel, "R", None)
+
+    def get_volume(self, channel: int):
+        return known(self.volume[channel])
+
+    def set_volume(self, channel: int, value) -> bool:
+        stored = self.volume[channel]
+        if value is None:
+            if stored != stored:
+                return False
+            self.volume[channel] = UNKNOWN
+        elif value == stored:
+            return False
+        else:
+            self.volume[channel] = value
+        self.publish("volume", channel, value)
+        return True
+
+    def get_mute(self, channel: int):
+        mute = self.mute[channel]
+        if mute == UNKNOWN_MUTE:
+            return None
+        return mute == 1
+
+    def set_mute(self, channel: int, mute) -> bool:
+        value = UNKNOWN_MUTE if mute is None else int(mute)
+        if value == self.mute[channel]:
+            return False
+        self.mute[channel] = value
+        self.publish("mute", channel, mute)
+        return True
+
+    def get_level(self, channel: int, side="L"):
+        if side == "R":
+            return known(self.level_r[channel])
+        return known(self.level_l[channel])
+
+    def set_level(self, channel: int, side, value) -> bool:
+        column = self.level_r if side == "R" else self.level_l
+        stored = column[channel]
+        if value is None:
+            if stored != stored:
+                return False
+            column[channel] = UNKNOWN
+        elif value == stored:
+            return False
+        else:
+            column[channel] = value
+        self.publish("level", channel, value)
+        return True
+
+    def audible_volumes(self, channels):
+        """
+        Return the known volumes of all unmuted channels among the given ones
+        """
+        volume, mute = self.volume, self.mute
+        return [volume[c] for c in channels if volume[c] == volume[c] and mute[c] != 1]
+
+
+
+
+class StereoLevels():
+    """
+    View onto the left and right level of a stereo channel, used like a dict
+    with the keys "L" and "R"
+    """
+    __slots__ = ("state", "channel")
+
+    def __init__(self, state: MixerState, channel: int):
+        self.state   = state
+        self.channel = channel
+
+    def __getitem__(self, side):
+        if side not in ("L", "R"):
+            raise KeyError(side)
+        return self.state.get_level(self.channel, side)
+
+    def __setitem__(self, side, value):
+        if side not in ("L", "R"):
+            raise KeyError(side)
+        self.state.set_level(self.channel, side, value)
+
+    def keys(self):
+        return ("L", "R")
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        return repr({"L": self["L"], "R": self["R"]})
+
+
+
+
+class OutputState(namedtuple("OutputState", "name short stereo volume mute levels peaks stale", defaults=(None, False))):
+    """
+    Immutable snapshot of an Output, safe to hand to another thread. If meter
+    ballistics are used, levels holds the displayed (not the raw) levels and
+    peaks the peak hold values in the same shape. stale is True while the
+    values might be outdated because TotalMix stopped answering
+    """
+    __slots__ = ()
+
+    @property
+    def mono(self) -> bool:
+        return not self.stereo
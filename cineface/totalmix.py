@@ -1,184 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import sys
+import time
+from functools import partial
+
 from cineface.helpers import fit, clamp, lerp, nothing
+from cineface.curve import FADER_CURVE, db_to_fader, fader_to_db
 from cineface.hardware import LedButton
-
-# db to fadercurve lookup table (pulled by sweeping fader via code)
-FADER_CURVE = [
-    (-65.0, 0.0),
-    (-63.5, 0.00999998115003109),
-    (-62.0, 0.020000021904706955),
-    (-60.5, 0.030000003054738045),
-    (-59.0, 0.039999984204769135),
-    (-57.6, 0.05000002309679985),
-    (-56.2, 0.06000000610947609),
-    (-54.7, 0.06999998539686203),
-    (-53.4, 0.07999996840953827),
-    (-52.0, 0.09000000357627869),
-    (-50.6, 0.09000000357627869),
-    (-49.3, 0.10999996960163116),
-    (-48.0, 0.1199999526143074),
-    (-46.7, 0.12999999523162842),
-    (-45.4, 0.13999997079372406),
-    (-44.2, 0.15000000596046448),
-    (-42.9, 0.1599999964237213),
-    (-41.7, 0.16999997198581696),
-    (-40.5, 0.18000000715255737),
-    (-39.3, 0.1899999976158142),
-    (-38.2, 0.20000003278255463),
-    (-37.0, 0.21000002324581146),
-    (-35.9, 0.2199999988079071),
-    (-34.8, 0.22999997437000275),
-    (-33.7, 0.24000002443790436),
-    (-32.6, 0.25),
-    (-31.6, 0.25999999046325684),
-    (-30.6, 0.27000001072883606),
-    (-29.5, 0.2800000011920929),
-    (-28.6, 0.28999999165534973),
-    (-27.6, 0.30000001192092896),
-    (-26.6, 0.3099999725818634),
-    (-25.7, 0.3199999928474426),
-    (-24.8, 0.33000001311302185),
-    (-23.9, 0.3400000035762787),
-    (-23.0, 0.3499999940395355),
-    (-22.1, 0.36000001430511475),
-    (-21.3, 0.3700000047683716),
-    (-20.5, 0.3799999952316284),
-    (-19.7, 0.3799999952316284),
-    (-18.9, 0.4000000059604645),
-    (-18.1, 0.4099999666213989),
-    (-17.4, 0.41999998688697815),
-    (-16.7, 0.429999977350235),
-    (-16.0, 0.4399999976158142),
-    (-15.3, 0.44999998807907104),
-    (-14.6, 0.46000000834465027),
-    (-14.0, 0.4699999988079071),
-    (-13.3, 0.47999998927116394),
-    (-12.7, 0.49000000953674316),
-    (-12.1, 0.5),
-    (-12.0, 0.502),
-    (-11.6, 0.5099999904632568),
-    (-11.0, 0.5199999213218689),
-    (-10.5, 0.5299999713897705),
-    (-9.9, 0.5400000214576721),
-    (-9.4, 0.550000011920929),
-    (-9.0, 0.5600000023841858),
-    (-8.5, 0.5699999928474426),
-    (-8.1, 0.5799999833106995),
-    (-7.6, 0.5899999141693115),
-    (-7.2, 0.6000000238418579),
-    (-6.9, 0.6100000143051147),
-    (-6.5, 0.6200000047683716),
-    (-6.1, 0.6299999952316284),
-    (-6.0, 0.634),
-    (-5.8, 0.6399999260902405),
-    (-5.5, 0.6499999165534973),
-    (-5.2, 0.6600000262260437),
-    (-4.8, 0.6699999570846558),
-    (-4.5, 0.6799999475479126),
-    (-4.2, 0.6899999380111694),
-    (-3.8, 0.6999999284744263),
-    (-3.5, 0.7099999189376831),
-    (-3.2, 0.7200000286102295),
-    (-2.9, 0.7299999594688416),
-    (-2.5, 0.7399999499320984),
-    (-2.2, 0.7499999403953552),
-    (-1.9, 0.7599999308586121),
-    (-1.5, 0.7699999213218689),
-    (-1.2, 0.7799999117851257),
-    (-0.9, 0.7899999618530273),
-    (-0.6, 0.7999999523162842),
-    (-0.2, 0.809999942779541),
-    (0.0, 0.817),
-    (0.1, 0.8199999332427979),
-    (0.4, 0.8299999237060547),
-    (0.7, 0.8399999141693115),
-    (1.1, 0.8499999642372131),
-    (1.4, 0.85999995470047),
-    (1.7, 0.8699999451637268),
-    (2.1, 0.8799999356269836),
-    (2.4, 0.8899999260902405),
-    (2.7, 0.8999999165534973),
-    (3.0, 0.909),
-    (3.4, 0.9199999570846558),
-    (3.7, 0.9299999475479126),
-    (4.0, 0.9399999380111694),
-    (4.4, 0.9499999284744263),
-    (4.7, 0.9599999189376831),
-    (5.0, 0.9699999690055847),
-    (5.3, 0.9799999594688416),
-    (5.7, 0.9899999499320984),
-    (6.0, 1.0),
-]
-
-
-def db_to_fader(x):
-    """
-    Transform a db value to a fader value
-    This is essentially a linear interpolation between the meassured points
-    stored in FADER_CURVE
-    """
-    x = clamp(x, FADER_CURVE[0][0], FADER_CURVE[-1][0])
-    
-    # If the value is in the list return it directly
-    if x in [db for (db, fader) in FADER_CURVE]:
-        i = [db for (db, fader) in FADER_CURVE].index(x)
-        return FADER_CURVE[i][1]
-    
-    # Find the next smaller value (or use the smallest one)
-    if x != FADER_CURVE[0][0]:
-        next_smaller = max([(db, fader) for (db, fader) in FADER_CURVE if db < x])
-    else:
-        next_smaller = FADER_CURVE[0]
-        
-    # Find the next bigger value (or use the smallest one)
-    if x != FADER_CURVE[-1][0]:
-        next_bigger = min([(db, fader) for (db, fader) in FADER_CURVE if db > x])
-    else:
-        next_bigger = FADER_CURVE[-1]
-    # On a range of 0.0 to 1.0, how far has x traveled between
-    # next_smaller and next_bigger?
-    factor = 1-(1/(next_smaller[0]-next_bigger[0]))*(x-next_bigger[0])
-    
-    # Linearily interpolate between the values
-    blended_value = lerp(factor, next_smaller[1], next_bigger[1])
-    
-    return blended_value
-
-
-def fader_to_db(x):
-    """
-    Transform a fader value to a db value
-    This is essentially a linear interpolation between the meassured points
-    stored in FADER_CURVE
-    """
-    x = clamp(x, FADER_CURVE[0][1], FADER_CURVE[-1][1])
-    
-    # If the value is in the list return it directly
-    if x in [fader for (db, fader) in FADER_CURVE]:
-        i = [fader for (db, fader) in FADER_CURVE].index(x)
-        return FADER_CURVE[i][0]
-    
-    # Find the next smaller value (or use the smallest one)
-    if x != FADER_CURVE[0][1]:
-        next_smaller = max([(db, fader) for (db, fader) in FADER_CURVE if fader < x])
-    else:
-        next_smaller = FADER_CURVE[0]
-        
-    # Find the next bigger value (or use the smallest one)
-    if x != FADER_CURVE[-1][1]:
-        next_bigger = min([(db, fader) for (db, fader) in FADER_CURVE if fader > x])
-    else:
-        next_bigger = FADER_CURVE[-1]
-    # On a range of 0.0 to 1.0, how far has x traveled between
-    # next_smaller and next_bigger?
-    factor = 1-(1/(next_smaller[1]-next_bigger[1]))*(x-next_bigger[1])
-    
-    # Linearily interpolate between the values
-    blended_value = lerp(factor, next_smaller[0], next_bigger[0], minimum=FADER_CURVE[0][0], maximum=FADER_CURVE[-1][0])
-    
-    return blended_value  
+from cineface.osc import BankSession, build_bundle
+from cineface.meters import MeterBallistics
+from cineface.state import FIELDS, MixerState, OutputState, StereoLevels
 
 
 
@@ -186,57 +18,98 @@ def fader_to_db(x):
 class Output():
     """
     Represents a single RME Totalmix Output channel
+
+    Volume, mute and levels are stored in one channel of a MixerState (shared
+    between all outputs of an Outputs collection), the attributes are views
+    onto it
     """
-    def __init__(self, name: str, short: str, address: str, stereo=False, gpio_button=None, gpio_led=None):
+    def __init__(self, name: str, short: str, address: str, stereo=False, gpio_button=None, gpio_led=None, state=None, independent_volume=None, channel=None):
         # Name is an arbitrary string for reference
         self.name = name
 
+        # Outputs with an independent volume (e.g. headphones) are allowed to be
+        # at a different level than the rest. Defaults to True for outputs whose
+        # name starts with "headphones"
+        if independent_volume is None:
+            independent_volume = name.lower().startswith("headphones")
+        self.independent_volume = independent_volume
+
         # Short Name, used on Levels display
         self.short = short
 
         # Address is the OSC Address (e.g. /1/volume4)
         self.address = address
 
-        # Stores the current position of the volume (0.0 to 1.0)
-        self.volume = None
-
-        # Stores the current mute state
-        self.mute = None
-
         # Outputs can be either Stereo or Mono
         self.stereo = stereo
 
+        # Stores volume (0.0 to 1.0), mute state and levels of this output
+        if state is None:
+            state = MixerState()
+        self.state = state
+        if channel is None:
+            self.channel = state.add_channel()
+        else:
+            # Take over the channel of a replaced output
+            self.channel = channel
+
         # Client used to communicate with Totalmix via OSC, register first
         self.client = None
 
+        # Tracks whether the output bus has to be selected before a command
+        # (shared between all outputs of an Outputs collection)
+        self.session = BankSession()
+
+        # If registered, volume changes are coalesced by this OutboundScheduler
+        # instead of being sent right away
+        self.scheduler = None
+
         # Stores the bin of the corresponding button
         self.gpio_button = int(gpio_button)
 
         # Stores the bin of the corresponding led
         self.gpio_led = int(gpio_led)
 
+        # The mute state sent last, until TotalMix reported it
+        self.requested_mute = None
+
         # Create a button that unmutes/mutes this output
-        self.button = LedButton(
-            button_pin=self.gpio_button, 
-            led_pin=self.gpio_led,
-            mute=self.set_mute,
-            unmute=self.set_unmute
-        )
+        self.button = None
+        self.open()
 
         # Levels store the current meter value (must be enabled in Totalmix
-        # OSC preferences). This is either a single float or a dict, depending
-        # on the number of channels
+        # OSC preferences). This is either a single float or a dict-like view,
+        # depending on the number of channels
         if self.stereo:
-            self.levels = {
-                "L" : None,
-                "R" : None
-            }
+            self.stereo_levels = StereoLevels(self.state, self.channel)
         else:
-            self.levels = None
+            self.stereo_levels = None
 
         # Stores the string for the display value (e.g. "6 dB" or "-oo")
         self.display_value = None
 
+        # If registered, meter levels are also fed into these MeterBallistics,
+        # meter_channels holds the indices of the left (and right) channel,
+        # meter_reserved all channels this output holds
+        self.meters = None
+        self.meter_channels = ()
+        self.meter_reserved = ()
+
+        # Maps every OSC address of this output to a prebound handler
+        self.routes = self.build_routes()
+
+        # Called whenever something changed that isn't published by the
+        # MixerState (e.g. the stale flag, see refresh)
+        self.on_change = nothing
+
+        # Set while the values might be outdated (TotalMix stopped answering),
+        # until fresh ones arrived for each of the fields in stale_fields
+        self.stale = False
+        self.stale_fields = set()
+
+        # Called when the output isn't stale anymore
+        self.on_refresh = nothing
+
     def as_table(self) -> str:
         label = "{}:".format(self.name)
         volume = "{}".format(self.display_value)
@@ -257,6 +130,113 @@ class Output():
     def __repr__(self):
         return self.address
 
+    @property
+    def volume(self):
+        """
+        The current position of the volume (0.0 to 1.0), None if unknown
+        """
+        return self.state.get_volume(self.channel)
+
+    @volume.setter
+    def volume(self, value):
+        self.state.set_volume(self.channel, value)
+
+    @property
+    def mute(self):
+        """
+        The current mute state, None if unknown
+        """
+        return self.state.get_mute(self.channel)
+
+    @mute.setter
+    def mute(self, value):
+        self.state.set_mute(self.channel, value)
+
+    @property
+    def levels(self):
+        """
+        The current meter level, a float for mono outputs and a view with the
+        keys "L" and "R" for stereo outputs
+        """
+        if self.stereo:
+            return self.stereo_levels
+        return self.state.get_level(self.channel)
+
+    @levels.setter
+    def levels(self, value):
+        if self.stereo:
+            self.stereo_levels["L"] = value["L"]
+            self.stereo_levels["R"] = value["R"]
+        else:
+            self.state.set_level(self.channel, "L", value)
+
+    def open(self):
+        """
+        Set up the GPIO button and LED (also again after close())
+        """
+        self.button = LedButton(
+            button_pin=self.gpio_button, 
+            led_pin=self.gpio_led,
+            toggle=self.toggle_mute
+        )
+
+        # The LED shows the mute state reported by TotalMix, it is only
+        # written when that state changed
+        self.state.subscribe("mute", self.mute_changed, self.channel)
+        self.mute_changed(self.channel, self.mute)
+
+    def close(self):
+        """
+        Release the GPIO pins of the button and LED
+        """
+        self.state.unsubscribe("mute", self.mute_changed, self.channel)
+        self.button.close()
+
+    def register_meters(self, meters, channels=()):
+        """
+        Feed the meter levels of this output into the given MeterBallistics.
+        The given channels (e.g. of a replaced output) are used before new
+        ones are added
+        """
+        self.meters = meters
+        channels = list(channels)
+        needed = 2 if self.stereo else 1
+        while len(channels) < needed:
+            channels.append(meters.add_channel())
+        for channel in channels:
+            meters.clear_channel(channel)
+
+        # A mono output keeps a second channel it was given, so switching
+        # back to stereo doesn't add another one
+        self.meter_reserved = tuple(channels)
+        self.meter_channels = self.meter_reserved[:2 if self.stereo else 1]
+
+    def snapshot(self) -> OutputState:
+        """
+        Return an immutable copy of the current state
+        """
+        levels = self.levels
+        peaks = None
+
+        if self.meters is None:
+            if self.stereo:
+                levels = dict(levels)
+        elif self.stereo:
+            if levels["L"] is not None and levels["R"] is not None:
+                left, right = self.meter_channels
+                levels = {"L": self.meters.value[left], "R": self.meters.value[right]}
+                if self.meters.has_peaks:
+                    peaks = {"L": self.meters.peak[left], "R": self.meters.peak[right]}
+            else:
+                levels = dict(levels)
+        elif levels is not None:
+            channel = self.meter_channels[0]
+            levels = self.meters.value[channel]
+            if self.meters.has_peaks:
+                peaks = self.meters.peak[channel]
+
+        return OutputState(self.name, self.short, self.stereo, self.volume, self.mute, levels, peaks, self.stale)
+
     def register_client(self, client):
         """
         Registers a given client with the output
@@ -304,73 +284,152 @@ class Output():
         """
         return "/1/mute/1/{}".format(self.number)
 
+    def build_routes(self) -> dict:
+        """
+        Build the routing table for this output: every OSC address it listens
+        to mapped to a handler with the field (and channel) already bound, so
+        incoming messages don't need any string formatting or comparisons
+        """
+        routes = {
+            self.address: self.update_volume,
+            self.address_display: self.update_display_value,
+            self.address_mute: self.update_mute,
+        }
+        if self.stereo:
+            left, right = self.address_levels
+            routes[left] = partial(self.update_level, "L")
+            routes[right] = partial(self.update_level, "R")
+        else:
+            routes[self.address_levels[0]] = partial(self.update_level, None)
+        return routes
+
     def is_valid_address(self, addr) -> bool:
         """
         Check if the given address belongs to this output
         """
-        return addr == self.address or addr == self.address_display or addr == self.address_mute or addr in self.address_levels
+        return addr in self.routes
 
     def update(self, addr, value):
         """
         Update all values with the ones coming from TotalMix
         """
-        if addr == self.address:
-            self.volume = value
-        elif addr == self.address_display:
-            self.display_value = value
-        elif addr == self.address_mute:
-            self.mute = value == 1.0
-            # Also notify the button/led of the change in status
-            self.button.update_led(self.mute)
-        elif addr in self.address_levels:
-            if self.stereo:
-                if addr.endswith("Left"):
-                    self.levels["L"] = value
-                elif addr.endswith("Right"):
-                    self.levels["R"] = value
-            else:
-                if addr.endswith("Left"):
-                    self.levels = value
+        handler = self.routes.get(addr)
+        if handler is not None:
+            handler(addr, value)
+
+    def mark_stale(self):
+        """
+        Mark the values as outdated until TotalMix sent the volume and the mute
+        state again
+        """
+        self.stale = True
+        self.stale_fields = {"volume", "mute"}
+
+    def refresh(self, field):
+        self.stale_fields.discard(field)
+        if not self.stale_fields:
+            self.stale = False
+            self.on_refresh()
+            self.on_change()
+
+    def mute_changed(self, channel, mute):
+        if mute is not None:
+            self.button.update_led(mute)
+
+    # The values are published by the MixerState if they differ from the
+    # stored ones, TotalMix repeating them costs a comparison
+
+    def update_volume(self, addr, value):
+        self.volume = value
+        if self.stale:
+            self.refresh("volume")
+
+    def update_display_value(self, addr, value):
+        self.display_value = value
+
+    def update_mute(self, addr, value):
+        self.mute = value == 1.0
+        if self.requested_mute == self.mute:
+            self.requested_mute = None
+        if self.stale:
+            self.refresh("mute")
+
+    def update_level(self, channel, addr, value):
+        """
+        Store a meter level. Channel is "L" or "R" for stereo outputs and None
+        for mono outputs
+        """
+        changed = self.state.set_level(self.channel, channel or "L", value)
+        if changed and self.meters is not None:
+            self.meters.set(self.meter_channels[1 if channel == "R" else 0], value)
+
+    def volume_message(self, volume: float):
+        """
+        Return the (address, value) message that sets the volume of the output
+        to a value between 0.0 and 1.0
+        """
+        # Clamp volume to range witrhin 0.0 and 1.0
+        return (self.address, clamp(volume, 0.0, 1.0))
+
+    def mute_message(self, mute: bool):
+        """
+        Return the (address, value) message that mutes or unmutes the output
+        """
+        return (self.address_mute, 1.0 if mute else 0.0)
 
     def set_volume(self, volume: float):
         """
         Set the volume of the output to a value between 0.0 and 1.0
         """
-        self.initialize()
+        if self.scheduler is not None:
+            self.scheduler.put(*self.volume_message(volume))
+            return
 
-        # Clamp volume to range witrhin 0.0 and 1.0
-        volume = clamp(volume, 0.0, 1.0)
+        self.initialize()
 
         # Send message
-        self.client.send_message(self.address, volume)
+        self.client.send_message(*self.volume_message(volume))
 
-    def set_mute(self):
+    def send_command(self, address, value):
         """
-        Mute the output
+        Send a discrete command right away. With an OutboundScheduler it goes
+        out in one bundle with the bank selection and pending volume changes
+        (on the event loop, see bridge.EventBridge)
         """
-        self.initialize()
+        if self.scheduler is not None:
+            self.scheduler.send_now(address, value)
+            return
 
-        # Send mute message
-        self.client.send_message(self.address_mute, 1.0)
+        self.initialize()
+        self.client.send_message(address, value)
 
-    def set_unmute(self):
+    def set_mute(self):
         """
         Mute the output
         """
-        self.initialize()
+        self.requested_mute = True
+        self.send_command(*self.mute_message(True))
 
-        # Send unmute message
-        self.client.send_message(self.address_mute, 0.0)
+    def set_unmute(self):
+        """
+        Unmute the output
+        """
+        self.requested_mute = False
+        self.send_command(*self.mute_message(False))
 
     def toggle_mute(self):
         """
         Mute the output if it was unmuted before
         Unmute the output if it was muted before
-        """
-        self.initialize()
 
-        # Send mute/unmute message depending on previous state
-        if self.mute:
+        Toggles the last requested state until TotalMix reported it, so
+        presses in quick succession alternate. Nothing is sent while the
+        state is unknown
+        """
+        mute = self.mute if self.requested_mute is None else self.requested_mute
+        if mute is None:
+            print("Mute state of {} is unknown, not toggling".format(self.name))
+        elif mute:
             print("toggling mute OFF")
             self.set_unmute()
         else:
@@ -378,9 +437,9 @@ class Output():
             self.set_mute()
 
     def initialize(self):
-        # Select output bus
-        self.client.send_message("/setBankStart", 1.0)
-        self.client.send_message("/1/busOutput", 1.0)
+        # Select output bus (unless TotalMix has it selected already)
+        for address, value in self.session.selection():
+            self.client.send_message(address, value)
 
 
 
@@ -393,28 +452,321 @@ class Outputs():
         self.faders = []
         self.pre_mute_states = []
 
+        # Client used to communicate with Totalmix via OSC, register first
+        self.client = None
+
+        # Tracks the bank/bus selection in TotalMix for all outputs
+        self.session = BankSession()
+
+        # If registered, volume changes and commands go through this
+        # OutboundScheduler (see register_scheduler)
+        self.scheduler = None
+
+        # If registered, button presses are handled on the event loop through
+        # this bridge.EventBridge instead of on gpiozero's thread
+        self.bridge = None
+
+        # Ballistics for the meter levels of all outputs
+        self.meters = MeterBallistics()
+
+        # Volume, mute state and levels of all outputs
+        self.state = MixerState()
+        self.state.subscribe("volume", self.aggregate_changed)
+        self.state.subscribe("mute", self.aggregate_changed)
+
+        # Channels of all outputs, and of those that count towards a uniform
+        # volume (see has_uniform_volume)
+        self.channels = []
+        self.uniform_channels = []
+
+        # Aggregates, updated whenever a volume or mute state changes
+        self._volume = -9000.0
+        self._volume_db = fader_to_db(self._volume)
+        self._has_uniform_volume = True
+        self._fader_volume = -9000.0
+
+        # Maps every OSC address of every output to its handler
+        self.routes = self.session.routes()
+
+        # Callables that are called whenever the state of an output changed,
+        # and the subscriber and fields each one is subscribed with in the
+        # MixerState
+        self.listeners = []
+        self.subscriptions = {}
+
+        # Callables that are called with the new volume whenever it changed
+        self.volume_listeners = []
+
+        # Number of outputs whose values might be outdated (see mark_stale)
+        self.stale_outputs = 0
+
+        # Called once the last stale output received fresh values
+        self.on_resync = nothing
+
+        # The Dispatcher the routes are mapped on, the wrapper applied to the
+        # handlers and the Handler objects mapped per address (so single
+        # outputs can be replaced later)
+        self.dispatcher = None
+        self.wrap       = None
+        self.mapped     = {}
+
     def __iter__(self):
         for output in self.faders:
             yield output
 
     def from_config(self, config) -> 'Outputs':
+        self.meters.from_config(config)
+
         for output in config["Output"]:
-            o = Output(
-                name=output["name"],
-                short=output["short"],
-                address=output["address"],
-                stereo=output["stereo"],
-                gpio_button=output["gpio_button"],
-                gpio_led=output["gpio_led"]
-            )
+            o = self.create_output(output)
             self.faders.append(o)
+            self.routes.update(o.routes)
 
+        self.update_channels()
         return self
 
+    def create_output(self, output, replaces=None) -> Output:
+        """
+        Create an Output from an [[Output]] section of the config, connected
+        to the state, meters and hooks of this collection. If it replaces
+        another output, it takes over its state and meter channels
+        """
+        channel = None if replaces is None else replaces.channel
+        o = Output(
+            name=output["name"],
+            short=output["short"],
+            address=output["address"],
+            stereo=output["stereo"],
+            gpio_button=output["gpio_button"],
+            gpio_led=output["gpio_led"],
+            state=self.state,
+            independent_volume=output.get("independent_volume"),
+            channel=channel
+        )
+        o.on_change = self.notify
+        o.on_refresh = self.output_refreshed
+        o.session = self.session
+        o.register_meters(self.meters, () if replaces is None else replaces.meter_reserved)
+        if self.bridge is not None:
+            o.button.post = self.bridge.post
+        return o
+
+    def update_channels(self):
+        """
+        Collect the channels of all outputs, and of those that count towards a
+        uniform volume
+        """
+        self.channels = [o.channel for o in self.faders]
+        self.uniform_channels = [o.channel for o in self.faders if not o.independent_volume]
+
+    def replace_output(self, index: int, output):
+        """
+        Replace the output at index with a new one created from an [[Output]]
+        section of the config (e.g. after the config was reloaded). The new
+        output takes over the channels of the old one, its values are
+        requested from TotalMix again. If it can't be created, the old output
+        is kept
+        """
+        old = self.faders[index]
+
+        # The new output likely uses the same GPIO pins, release them first
+        old.close()
+        try:
+            o = self.create_output(output, old)
+        except Exception as e:
+            print("Error: Couldn't reload output \"{}\", keeping it as it was: {!r}".format(old.name, e), file=sys.stderr)
+            old.open()
+            if self.bridge is not None:
+                old.button.post = self.bridge.post
+            return old
+
+        # The values of the old output don't belong to the new one
+        self.state.clear_channel(o.channel)
+        if old.stale:
+            self.stale_outputs -= 1
+        for address in old.routes:
+            self.unmap_address(address)
+
+        o.scheduler = old.scheduler
+        if self.client is not None:
+            o.register_client(self.client)
+        self.faders[index] = o
+        for address, handler in o.routes.items():
+            self.map_address(address, handler)
+
+        self.update_channels()
+        self.update_aggregates()
+        if self.client is not None:
+            self.select_bank()
+        self.notify()
+        return o
+
     def register_client(self, client):
+        self.client = client
         for output in self.faders:
             output.register_client(client)
 
+    def register_scheduler(self, scheduler):
+        """
+        Send the volume changes of all outputs (and the commands to several
+        outputs) through the given OutboundScheduler
+        """
+        self.scheduler = scheduler
+        for output in self.faders:
+            output.scheduler = scheduler
+
+    def register_bridge(self, bridge):
+        """
+        Hand the button presses of all outputs to the event loop through the
+        given bridge.EventBridge
+        """
+        self.bridge = bridge
+        for output in self.faders:
+            output.button.post = bridge.post
+
+    def add_listener(self, listener, fields=FIELDS):
+        """
+        Call listener (without arguments) whenever one of the given fields of
+        an output changed, e.g. to wake up a display. It is also called on
+        changes that affect everything (stale outputs, a reloaded config)
+        """
+        subscriber = lambda channel, value: listener()
+        self.listeners.append(listener)
+        self.subscriptions[listener] = (subscriber, fields)
+        for field in fields:
+            self.state.subscribe(field, subscriber)
+
+    def remove_listener(self, listener):
+        """
+        Stop calling a listener added with add_listener
+        """
+        self.listeners.remove(listener)
+        subscriber, fields = self.subscriptions.pop(listener)
+        for field in fields:
+            self.state.unsubscribe(field, subscriber)
+
+    def add_volume_listener(self, listener):
+        """
+        Call listener with the new volume of the outputs set_volume() controls
+        (see fader_volume) whenever it changed, e.g. to move a motor fader
+        """
+        self.volume_listeners.append(listener)
+
+    def notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def snapshot(self) -> tuple:
+        """
+        Return an immutable copy of the state of all outputs
+        """
+        return tuple(output.snapshot() for output in self.faders)
+
+    def meter_snapshot(self) -> tuple:
+        """
+        Advance the meter ballistics to now and return a snapshot
+        """
+        self.meters.step(time.monotonic())
+        return self.snapshot()
+
+    def register_dispatcher(self, dispatcher, wrap=None):
+        """
+        Map every address of the routing table on the given Dispatcher. If
+        given, wrap(handler) is mapped instead of each handler (used to
+        instrument them)
+        """
+        self.dispatcher = dispatcher
+        self.wrap = wrap
+        for address, handler in self.routes.items():
+            self.map_address(address, handler)
+
+    def map_address(self, address, handler):
+        """
+        Add an address to the routing table (and the registered Dispatcher)
+        """
+        self.routes[address] = handler
+        if self.dispatcher is not None:
+            if self.wrap is not None:
+                handler = self.wrap(handler)
+            self.mapped[address] = self.dispatcher.map(address, handler)
+
+    def unmap_address(self, address):
+        """
+        Remove an address from the routing table (and the registered Dispatcher)
+        """
+        self.routes.pop(address, None)
+        handler = self.mapped.pop(address, None)
+        if handler is not None:
+            self.dispatcher.unmap(address, handler)
+
+    def update(self, addr, value):
+        """
+        Route a message received from TotalMix to the output it belongs to
+        """
+        handler = self.routes.get(addr)
+        if handler is not None:
+            handler(addr, value)
+
+    def mark_stale(self):
+        """
+        Mark all outputs as outdated (e.g. because TotalMix stopped answering)
+        until TotalMix sent their state again
+        """
+        for output in self.faders:
+            if not output.stale:
+                output.mark_stale()
+                self.stale_outputs += 1
+        self.notify()
+
+    def output_refreshed(self):
+        self.stale_outputs -= 1
+        if self.stale_outputs == 0:
+            self.on_resync()
+
+    @property
+    def stale(self) -> bool:
+        """
+        Return true if the values of any output might be outdated
+        """
+        return self.stale_outputs > 0
+
+    def select_bank(self):
+        """
+        Select the output bus in TotalMix (regardless of the known selection)
+        """
+        self.session.invalidate()
+        self.client.send(build_bundle(self.session.selection()))
+
+    def send_batch(self, messages):
+        """
+        Send the bank selection (if needed) followed by all given (address, value)
+        messages as a single OSC bundle, so TotalMix applies them together
+        """
+        if messages:
+            self.client.send(build_bundle(self.session.selection() + messages))
+
+    def send_commands(self, messages):
+        """
+        Send commands to several outputs in one bundle. With an
+        OutboundScheduler they go through it, replacing volume changes that
+        are still pending for the same outputs
+        """
+        if self.scheduler is not None:
+            self.scheduler.send_all(messages)
+        else:
+            self.send_batch(messages)
+
+    def set_volume(self, volume: float):
+        """
+        Set all outputs except the ones with an independent volume (like
+        headphones) to a volume between 0.0 and 1.0, e.g. from the volume
+        potentiometer. Can be called from another thread once an
+        OutboundScheduler is registered
+        """
+        for o in self.faders:
+            if not o.independent_volume:
+                o.set_volume(volume)
+
     def mute_all(self):
         """
         Mute all output channels and store the formerly muted state.
@@ -423,79 +775,113 @@ class Outputs():
         """
         # Run only if not all muted already
         if not all([o.mute for o in self.faders]):
-            for i, output in enumerate(self.faders):
-                # Frist save previous state
-                self.pre_mute_states[i] = output.mute
+            # Frist save previous state
+            self.pre_mute_states = [o.mute for o in self.faders]
 
-                # Second mute the output
-                output.set_mute()
+            # Second mute the outputs
+            self.send_commands([o.mute_message(True) for o in self.faders])
 
     def undo_mute_all(self):
         """
         Undo mute_all and return back to the state before (formerly muted outputs
         will remain muted, formerly unmuted ones will be unmuted again)
         """
-        for i, output in enumerate(self.faders):
-            # Unmute Outputs only if they have been previously unmuted
-            if self.pre_mute_states[i]:
-                output.set_unmute()
+        # Unmute Outputs only if they have been previously unmuted
+        self.send_commands([
+            o.mute_message(False)
+            for o, was_muted in zip(self.faders, self.pre_mute_states)
+            if not was_muted
+        ])
 
     def unmute_all(self):
         """
         Unmute all output channels (regardless of previous state)
         """
-        for output in self.faders:
-            output.set_unmute(self.client)
+        self.send_commands([o.mute_message(False) for o in self.faders])
 
-    def invert_mutes(self, client):
+    def invert_mutes(self):
         """
         Unmute all muted Tracks, mute all unmuted ones
         """
-        for output in self.faders:
-            output.toggle_mute(client)
+        self.send_commands([o.mute_message(not o.mute) for o in self.faders])
 
     def dim(self):
         """
         Dim the volume of all outputs by -6db
         """
-        for i, output in enumerate(self.faders):
-            output.set_volume(output.volume * 0.7746)
+        self.send_commands([o.volume_message(o.volume * 0.7746) for o in self.faders if o.volume is not None])
 
     def undim(self):
         """
         Raise the volume of all outputs by +6db
         """
-        for i, output in enumerate(self.faders):
-            output.set_volume(output.volume * 1/0.7746)
+        self.send_commands([o.volume_message(o.volume * 1/0.7746) for o in self.faders if o.volume is not None])
 
     def silence(self):
         """
         Set all outputs to 0.0
         """
-        for i, output in enumerate(self.faders):
-            output.set_volume(0.0)
+        self.send_commands([o.volume_message(0.0) for o in self.faders])
 
-    @property
-    def volume(self) -> float:
+    def aggregate_changed(self, channel, value):
+        self.update_aggregates()
+
+    def update_aggregates(self):
         """
-        Return highest volume of all outputs in fader scale (0.0 to 1.0)
+        Recompute volume, volume_db, has_uniform_volume and fader_volume.
+        Called whenever a volume or mute state changed, so reading them is free
         """
         # Get a list of volumes
-        volumes = [o.volume for o in self.faders if o.volume is not None and not o.mute]
+        volumes = self.state.audible_volumes(self.channels)
 
         # Make sure we actually have volumes to process
         if len(volumes) >= 1:
-            biggest_volume = max(volumes)
-            return biggest_volume
+            volume = max(volumes)
         else:
-            return -9000.0
+            volume = -9000.0
+        if volume != self._volume:
+            self._volume = volume
+            self._volume_db = fader_to_db(volume)
+
+        # Get a list of volumes (without outputs with an independent volume like
+        # headphones, they are allowed to be at a different level than the
+        # rest). Ignore muted outputs because they dont matter
+        volumes = self.state.audible_volumes(self.uniform_channels)
+        if len(volumes) >= 1:
+            self._has_uniform_volume = max(volumes) == min(volumes)
+            fader_volume = max(volumes)
+        else:
+            self._has_uniform_volume = True
+            fader_volume = -9000.0
+
+        # The fader shows (and moves to) the outputs it controls, a louder
+        # headphone output must not pull it away from the speakers
+        if fader_volume != self._fader_volume:
+            self._fader_volume = fader_volume
+            for listener in self.volume_listeners:
+                listener(fader_volume)
+
+    @property
+    def volume(self) -> float:
+        """
+        Return highest volume of all outputs in fader scale (0.0 to 1.0)
+        """
+        return self._volume
 
     @property
     def volume_db(self) -> float:
         """
         Return highest volume of all outputs in db scale (-65.0 to +6.0)
         """
-        return fader_to_db(self.volume)
+        return self._volume_db
+
+    @property
+    def fader_volume(self) -> float:
+        """
+        Return highest volume of the outputs set_volume() controls (all but
+        the ones with an independent volume) in fader scale
+        """
+        return self._fader_volume
 
     @property
     def has_uniform_volume(self) -> bool:
@@ -504,14 +890,4 @@ class Outputs():
         This is used to signify to the user that some outputs might in fact be
         at a different volume than expected
         """
-        # Get a list of volumes (exclude headphones here because they are allowed
-        # to be at a different level than the rest). Ignore muted outputs because 
-        # they dont matter
-        volumes = [o.volume for o in self.faders if o.volume is not None and not o.name.lower().startswith("headphones") and not o.mute]
-        # Make sure we actually have volumes to process
-        if len(volumes) >= 1:
-            biggest_volume = max(volumes)
-            lowest_volume = min(volumes)
-            return biggest_volume == lowest_volume
-        else:
-            return True
\ No newline at end of file
+        return self._has_uniform_volume
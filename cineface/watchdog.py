@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+
+# Resyncs that take longer than this many seconds are reported as too slow
+RESYNC_TARGET = 1.0
+
+
+
+
+class Watchdog():
+    """
+    Notices when TotalMix goes silent (e.g. because it was closed or restarted)
+    and brings the outputs back in sync once it answers again.
+
+    Every datagram received resets the timer. After timeout seconds of silence
+    the bank and bus selection is sent as a probe: TotalMix answers it with a
+    full dump of the bus, so an idle but running TotalMix (meters disabled)
+    just causes a dump every timeout seconds. If a probe stays unanswered, the
+    outputs are marked stale (which both displays show) and the probe is
+    repeated with exponential backoff up to max_backoff seconds. The first
+    datagram after that selects the bus again, the resync is complete once
+    every output received its volume and mute state. The time that took is
+    printed and kept in resync_times.
+
+    outputs needs select_bank(), mark_stale() and an on_resync hook (see
+    totalmix.Outputs)
+    """
+
+    def __init__(self, outputs, timeout=2.0, min_backoff=0.125, max_backoff=1.0):
+        self.outputs     = outputs
+        self.timeout     = timeout
+        self.min_backoff = min_backoff
+
+        # Without meters enabled TotalMix only sends when it is asked to, so
+        # this bounds how long it takes to notice that it is back
+        self.max_backoff = max_backoff
+
+        self.backoff      = min_backoff
+        self.last_message = time.monotonic()
+
+        # Probes sent since the last datagram arrived
+        self.probes = 0
+
+        # Whether TotalMix didn't answer a probe, and when it came back
+        self.lost    = False
+        self.back_at = None
+
+        # Durations from TotalMix answering again to all outputs being in sync
+        self.resync_times = []
+
+        outputs.on_resync = self.resynced
+
+    def watch(self, dispatcher):
+        """
+        Feed the watchdog with every datagram the dispatcher handles
+        """
+        call_handlers_for_packet = dispatcher.call_handlers_for_packet
+
+        def fed(data, client_address):
+            self.feed()
+            return call_handlers_for_packet(data, client_address)
+
+        dispatcher.call_handlers_for_packet = fed
+
+    def feed(self):
+        self.last_message = time.monotonic()
+        if self.probes:
+            self.probes  = 0
+            self.backoff = self.min_backoff
+            if self.lost:
+                self.recover()
+
+    def probe(self):
+        self.probes += 1
+        self.outputs.select_bank()
+
+    def lose(self):
+        print("TotalMix doesn't answer, marking all outputs as stale")
+        self.lost = True
+        self.back_at = None
+        self.outputs.mark_stale()
+
+    def recover(self):
+        """
+        TotalMix answered again (maybe after a restart, so it might have
+        another bus selected): ask for the full state
+        """
+        print("TotalMix is back, resyncing")
+        self.lost = False
+        self.back_at = self.last_message
+        self.outputs.select_bank()
+
+    def resynced(self):
+        """
+        Called by the outputs once none of them is stale anymore
+        """
+        if self.back_at is None:
+            return
+        duration = time.monotonic() - self.back_at
+        self.back_at = None
+        self.resync_times.append(duration)
+        if duration > RESYNC_TARGET:
+            print("Warning: resyncing with TotalMix took {:.0f} ms".format(duration * 1000))
+        else:
+            print("Resynced with TotalMix in {:.0f} ms".format(duration * 1000))
+
+    async def run(self):
+        while True:
+            wait = self.last_message + self.timeout - time.monotonic()
+            if self.probes == 0 and wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            # The last probe wasn't answered
+            if self.probes > 0 and not self.lost:
+                self.lose()
+
+            self.probe()
+            await asyncio.sleep(self.backoff)
+            self.backoff = min(self.backoff * 2, self.max_backoff)
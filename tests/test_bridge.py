@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+from cineface.bridge import EventBridge
+
+
+async def wait_for_event(handled):
+    while not handled:
+        await asyncio.sleep(0.001)
+
+
+def test_events_from_other_threads_run_on_the_loop():
+    bridge = EventBridge()
+    handled = []
+
+    async def scenario():
+        bridge.attach(asyncio.get_running_loop())
+        loop_thread = threading.get_ident()
+        thread = threading.Thread(target=bridge.post, args=(lambda: handled.append(threading.get_ident() == loop_thread),))
+        thread.start()
+        thread.join()
+        await asyncio.wait_for(wait_for_event(handled), 2.0)
+
+    asyncio.run(scenario())
+    assert handled == [True]
+    assert bridge.handled == 1
+    assert bridge.latency.n == 1
+
+
+def test_events_beyond_maxsize_are_dropped():
+    bridge = EventBridge(maxsize=2)
+    handled = []
+
+    async def scenario():
+        bridge.attach(asyncio.get_running_loop())
+        # The loop doesn't get to run in between, so the events pile up
+        for i in range(5):
+            bridge.post(handled.append, i)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert handled == [0, 1]
+    assert bridge.dropped == 3
+
+    # Events before the bridge is attached can't be handled
+    EventBridge().post(handled.append, 5)
+    assert handled == [0, 1]
+
+
+def test_events_after_the_loop_closed_are_dropped():
+    bridge = EventBridge()
+    loop = asyncio.new_event_loop()
+    bridge.attach(loop)
+    loop.close()
+
+    bridge.post(print)
+    bridge.detach()
+    bridge.post(print)
+    assert bridge.dropped == 2
+    assert bridge.pending == 0
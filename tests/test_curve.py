@@ -0,0 +1,38 @@
+from cineface.curve import CURVE, FADER_CURVE, db_to_fader, fader_to_db
+
+
+def test_measured_points_are_returned_directly():
+    for db, fader in FADER_CURVE:
+        assert db_to_fader(db) == fader
+
+
+def test_values_are_clamped():
+    assert db_to_fader(-100.0) == 0.0
+    assert db_to_fader(12.0) == 1.0
+    assert fader_to_db(-1.0) == -65.0
+    assert fader_to_db(2.0) == 6.0
+
+
+def test_repeated_fader_points():
+    # 0.09 and 0.38 appear twice in the measured curve
+    assert fader_to_db(0.09000000357627869) == -52.0
+    assert -50.6 < fader_to_db(0.1) < -49.3
+    assert -19.7 < fader_to_db(0.39) < -18.9
+
+
+def test_arrays_match_scalars():
+    values = [i / 100 for i in range(-10, 111)]
+    for a, b in zip(CURVE.to_db_array(values), values):
+        assert a == fader_to_db(b)
+
+
+def test_arrays_with_and_without_numpy(monkeypatch):
+    import cineface.curve
+    with_numpy = CURVE.to_fader_array([-70.0, -12.0, -3.0])
+    monkeypatch.setattr(cineface.curve, "load_numpy", lambda: None)
+    without_numpy = CURVE.to_fader_array([-70.0, -12.0, -3.0])
+
+    assert with_numpy == without_numpy == [0.0, 0.502, db_to_fader(-3.0)]
+    assert CURVE.to_db_array(0.5) == [-12.1]
+    monkeypatch.undo()
+    assert CURVE.to_db_array(0.5) == [-12.1]
@@ -0,0 +1,25 @@
+from PIL import Image
+
+from cineface.devices import changed_spans, pack_pages
+
+
+def test_pack_pages_bit_order():
+    image = Image.new("1", (128, 64))
+    image.putpixel((3, 0), 1)
+    image.putpixel((3, 9), 1)
+    pages = pack_pages(image, 8)
+
+    assert len(pages) == 8
+    assert pages[0][3] == 0x01
+    assert pages[1][3] == 0x02
+    assert sum(pages[2]) == 0
+
+
+def test_changed_spans_merges_close_ranges():
+    old = bytes(128)
+    new = bytearray(old)
+    new[10] = new[12] = 1
+    new[100] = 1
+
+    assert changed_spans(old, bytes(new)) == [(10, 13), (100, 101)]
+    assert changed_spans(old, old) == []
@@ -0,0 +1,22 @@
+from cineface.display import FrameCache, all_db_texts, format_db
+
+
+def test_format_db():
+    assert format_db(None) == "n.a."
+    assert format_db(-70.0) == "-∞"
+    assert format_db(0.0) == " 0.0"
+    assert format_db(3.14) == "+3.1"
+    assert format_db(-12.0) == "-12.0"
+    assert len(set(all_db_texts())) == 712
+
+
+def test_frame_cache_evicts_least_recently_used():
+    cache = FrameCache(lambda text, warning: (text, warning), maxsize=2)
+    cache.get(("a", True))
+    cache.get(("b", True))
+    cache.get(("a", True))
+    cache.get(("c", True))
+
+    assert ("a", True) in cache
+    assert ("b", True) not in cache
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 3, 1)
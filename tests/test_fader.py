@@ -0,0 +1,104 @@
+import random
+import time
+
+from cineface.curve import FaderCurve
+from cineface.fader import PID, MotorFader, SimulatedFader
+
+
+def test_pid_does_not_wind_up_while_saturated():
+    pid = PID(kp=1.0, ki=1.0, kd=0.0)
+    for _ in range(100):
+        assert pid.update(5.0, 0.01) == 1.0
+
+    assert pid.integral == 0.0
+
+
+def test_default_scale_maps_volume_onto_travel():
+    fader = MotorFader(SimulatedFader())
+
+    assert abs(fader.travel(0.5) - 0.5) < 1e-9
+    assert abs(fader.volume(0.817) - 0.817) < 1e-9
+
+
+def test_custom_scale():
+    fader = MotorFader(SimulatedFader(), scale=FaderCurve([(-65.0, 0.0), (0.0, 0.5), (6.0, 1.0)]))
+
+    # 0 dB is at 0.817 in TotalMix and in the middle of this fader
+    assert abs(fader.travel(0.817) - 0.5) < 1e-9
+
+
+def test_simulated_fader_follows_target():
+    fader = MotorFader(SimulatedFader(), rate=500.0).start()
+    fader.set_volume(0.6)
+    deadline = time.perf_counter() + 2.0
+    while time.perf_counter() < deadline and abs(fader.driver.position - 0.6) > 0.01:
+        time.sleep(0.01)
+    fader.stop()
+
+    assert abs(fader.driver.position - 0.6) <= 0.01
+    assert fader.cycles > 0
+
+
+def test_sampler_ignores_noise_of_a_resting_knob():
+    from cineface.fader import VolumeSampler
+    sampler = VolumeSampler()
+    adc = SimulatedFader(position=0.6, noise=0.002)
+    random.seed(1)
+    for _ in range(2000):
+        sampler.add(adc.read_position())
+
+    assert sampler.samples == 2000
+    assert sampler.emitted == 0
+
+
+def test_sampler_emits_audible_changes_of_a_moving_knob():
+    from cineface.fader import VolumeSampler
+    sampler = VolumeSampler()
+    volumes = []
+    sampler.on_volume = volumes.append
+    for i in range(1001):
+        sampler.add(0.5 + 0.3 * i / 1000)
+
+    assert 0 < sampler.emitted < 200
+    assert abs(volumes[-1] - 0.8) < 0.01
+    assert volumes == sorted(volumes)
+
+
+def test_fixed_rate_thread_restores_the_switch_interval():
+    import sys
+    from cineface.fader import FixedRateThread
+    before = sys.getswitchinterval()
+    calls = []
+    thread = FixedRateThread(calls.append, rate=1000.0).start()
+    deadline = time.perf_counter() + 2.0
+    while time.perf_counter() < deadline and len(calls) < 10:
+        time.sleep(0.01)
+    thread.stop()
+
+    assert len(calls) >= 10
+    assert sys.getswitchinterval() == before
+
+
+def test_motor_moves_are_not_sent_back():
+    from cineface.fader import VolumeSampler
+    driver = SimulatedFader(position=0.3)
+    sampler = VolumeSampler(driver.read_position)
+    volumes = []
+    sampler.on_volume = volumes.append
+    fader = MotorFader(driver, rate=500.0)
+    fader.register_sampler(sampler)
+    fader.start()
+
+    # Let the sampler take the resting position, then move to 0 dB
+    time.sleep(0.05)
+    fader.set_volume(0.817)
+    deadline = time.perf_counter() + 2.0
+    while time.perf_counter() < deadline and (fader.target is not None or fader.settling):
+        time.sleep(0.01)
+    time.sleep(0.05)
+    fader.stop()
+
+    assert abs(driver.position - 0.817) <= 0.01
+    assert sampler.samples > 0
+    assert sampler.emitted == 0
+    assert volumes == []
@@ -0,0 +1,41 @@
+from pythonosc import osc_message_builder
+
+from cineface.latency import BUCKETS, Histogram, Latency
+from cineface.osc import RoutingDispatcher
+
+
+def test_histogram_buckets():
+    histogram = Histogram()
+    for seconds in (0.00001, 0.0015, 0.0015, 5.0):
+        histogram.record(seconds)
+
+    assert histogram.counts[0] == 1
+    assert histogram.counts[BUCKETS.index(0.002)] == 2
+    assert histogram.counts[-1] == 1
+    assert histogram.n == 4
+    assert histogram.max == 5.0
+
+
+def test_dispatch_and_update_are_timed():
+    latency = Latency()
+    dispatcher = RoutingDispatcher()
+    received = []
+    dispatcher.map("/1/volume1", latency.wrap_handler(lambda addr, value: received.append(value)))
+    latency.instrument_dispatcher(dispatcher)
+
+    message = osc_message_builder.OscMessageBuilder("/1/volume1")
+    message.add_arg(0.5)
+    dispatcher.call_handlers_for_packet(message.build().dgram, ("127.0.0.1", 7001))
+
+    assert received == [0.5]
+    assert latency.histograms["receive>dispatch"].n == 1
+    assert latency.histograms["dispatch>update"].n == 1
+    assert latency.last_change == latency.last_receive > 0.0
+
+
+def test_frames_without_new_changes_are_not_counted():
+    latency = Latency()
+    latency.frame("levels", 1.0, 1.1, 1.2)
+    latency.frame("levels", 1.0, 1.3, 1.4)
+
+    assert latency.histograms["levels total"].n == 1
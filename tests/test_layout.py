@@ -0,0 +1,35 @@
+from cineface.layout import LevelLayout
+
+
+OUTPUTS = [
+    ("headphones", "HP", True),
+    ("speakers", "L/R", True),
+    ("center", "C", False),
+    ("lfe", "LF", False),
+    ("rear", "Ls/Rs", True),
+]
+
+
+def measure(text):
+    return (len(text) * 5, 8)
+
+
+def test_slots_are_assigned_in_config_order():
+    layout = LevelLayout().compile(OUTPUTS, ["speakers", "center", "lfe", "rear"], ["headphones"], measure)
+
+    assert [o.name for o in layout] == ["speakers", "center", "lfe", "rear", "headphones"]
+    assert [bar.channel for bar in layout.get("speakers").bars] == ["L", "R"]
+    assert layout.get("center").bars[0].x0 == 2 * layout.slotwidth
+    assert layout.scale_slot == layout.slots - 2
+
+
+def test_right_outputs_are_placed_from_the_right_edge():
+    layout = LevelLayout().compile(OUTPUTS, [], ["headphones", "lfe"], measure)
+
+    left, right = layout.get("headphones").bars
+    assert right.x1 == layout.w
+    assert left.x1 == layout.w - layout.slotwidth
+    assert layout.get("lfe").bars[0].x1 == layout.w - 2 * layout.slotwidth
+    for output in layout:
+        for bar in output.bars:
+            assert bar.x0 < bar.x1
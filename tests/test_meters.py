@@ -0,0 +1,38 @@
+from cineface.meters import MeterBallistics
+
+
+def test_release_and_peak_hold():
+    meters = MeterBallistics(attack=0.0, release=0.1, hold=0.5)
+    channel = meters.add_channel()
+
+    meters.set(channel, 0.8)
+    meters.step(0.0)
+    assert meters.value[channel] == 0.8
+
+    # The level drops, the meter falls smoothly and the peak stays up
+    meters.set(channel, 0.0)
+    meters.step(0.1)
+    assert 0.0 < meters.value[channel] < 0.8
+    assert meters.peak[channel] == 0.8
+    assert not meters.settled
+
+    # Long after the hold time everything has fallen back
+    meters.step(5.0)
+    assert meters.value[channel] == 0.0
+    assert meters.peak[channel] == 0.0
+    assert meters.settled
+
+
+def test_movement_does_not_depend_on_step_count():
+    coarse = MeterBallistics(attack=0.05, release=0.1, hold=0.0)
+    fine = MeterBallistics(attack=0.05, release=0.1, hold=0.0)
+    for meters in (coarse, fine):
+        meters.add_channel()
+        meters.set(0, 1.0)
+        meters.step(0.0)
+
+    coarse.step(0.04)
+    for i in range(1, 5):
+        fine.step(i * 0.01)
+
+    assert abs(coarse.value[0] - fine.value[0]) < 1e-9
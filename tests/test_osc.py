@@ -0,0 +1,72 @@
+import asyncio
+
+from cineface.osc import BankSession, OutboundScheduler, RoutingDispatcher, build_bundle
+
+
+def test_exact_address_lookup():
+    dispatcher = RoutingDispatcher()
+    received = []
+    dispatcher.map("/1/volume1", lambda addr, value: received.append((addr, value)))
+
+    handlers = dispatcher.handlers_for_address("/1/volume1")
+    assert len(handlers) == 1
+    assert list(dispatcher.handlers_for_address("/1/volume2")) == []
+
+
+def test_wildcard_mapping_falls_back_to_matching():
+    dispatcher = RoutingDispatcher()
+    dispatcher.map("/*", lambda addr, value: None)
+
+    assert len(list(dispatcher.handlers_for_address("/anything"))) == 1
+
+
+def test_build_bundle_keeps_message_order():
+    bundle = build_bundle([("/setBankStart", 1.0), ("/1/mute/1/2", 1.0)])
+
+    assert [m.address for m in bundle] == ["/setBankStart", "/1/mute/1/2"]
+    assert [m.params for m in bundle] == [[1.0], [1.0]]
+
+
+def test_bank_session_skips_redundant_selections():
+    session = BankSession()
+
+    assert session.selection() == [("/setBankStart", 1.0), ("/1/busOutput", 1.0)]
+    assert session.selection() == []
+
+    # Someone selected the input bus in TotalMix
+    session.update_bus("/1/busInput", 1.0)
+    assert len(session.selection()) == 2
+    assert (session.selections_sent, session.selections_skipped) == (2, 1)
+
+
+def test_outbound_scheduler_coalesces_and_sends_final_value():
+    batches = []
+    scheduler = OutboundScheduler(batches.append, rate=100.0)
+
+    async def move_fader():
+        task = asyncio.ensure_future(scheduler.run())
+        for i in range(1, 11):
+            scheduler.put("/1/volume1", i / 10)
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(move_fader())
+
+    assert batches[0] == [("/1/volume1", 0.1)]
+    assert batches[-1] == [("/1/volume1", 1.0)]
+    assert scheduler.generated == 10
+    assert scheduler.sent + scheduler.coalesced == 10
+    assert scheduler.sent < 10
+
+
+def test_commands_replace_pending_changes():
+    batches = []
+    scheduler = OutboundScheduler(batches.append)
+    scheduler.put("/1/volume1", 0.7)
+    scheduler.put("/1/volume2", 0.7)
+    scheduler.send_all([("/1/volume1", 0.0)])
+
+    # A later flush can't bring back the old volume
+    scheduler.flush()
+    assert batches == [[("/1/volume1", 0.0), ("/1/volume2", 0.7)]]
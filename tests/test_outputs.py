@@ -0,0 +1,159 @@
+import time
+
+import toml
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory
+
+from cineface.config import EXAMPLE_CONFIG, Config
+from cineface.totalmix import Outputs
+
+
+def create_outputs():
+    """
+    The outputs of the example config (headphones, speakers, center, lfe and
+    rear) on mock GPIO pins
+    """
+    Device.pin_factory = MockFactory()
+    return Outputs().from_config(Config(toml.loads(EXAMPLE_CONFIG)))
+
+
+def receive(outputs, name, volume=None, mute=None):
+    output = next(o for o in outputs if o.name == name)
+    if volume is not None:
+        outputs.update(output.address, volume)
+    if mute is not None:
+        outputs.update(output.address_mute, 1.0 if mute else 0.0)
+    return output
+
+
+def test_fader_follows_the_outputs_it_controls():
+    outputs = create_outputs()
+    moves = []
+    outputs.add_volume_listener(moves.append)
+
+    receive(outputs, "speakers", 0.6)
+    receive(outputs, "headphones", 0.9)
+
+    # The headphones are the loudest, but the knob doesn't set them
+    assert outputs.volume == 0.9
+    assert outputs.fader_volume == 0.6
+    assert moves == [0.6]
+
+
+def test_silence_replaces_a_pending_volume_change():
+    from cineface.osc import OutboundScheduler
+    outputs = create_outputs()
+    batches = []
+    scheduler = OutboundScheduler(batches.append)
+    outputs.register_scheduler(scheduler)
+
+    outputs.set_volume(0.7)
+    outputs.silence()
+    scheduler.flush()
+
+    assert len(batches) == 1
+    assert {value for address, value in batches[0]} == {0.0}
+
+
+def test_aggregates_ignore_muted_and_independent_outputs():
+    from cineface.curve import fader_to_db
+    outputs = create_outputs()
+    receive(outputs, "speakers", 0.6, mute=False)
+    receive(outputs, "center", 0.6, mute=False)
+    receive(outputs, "headphones", 0.8, mute=False)
+
+    # Headphones are allowed to differ
+    assert outputs.volume == 0.8
+    assert outputs.volume_db == fader_to_db(0.8)
+    assert outputs.has_uniform_volume
+
+    receive(outputs, "rear", 0.5, mute=False)
+    assert not outputs.has_uniform_volume
+
+    # A muted output doesn't count
+    receive(outputs, "rear", mute=True)
+    receive(outputs, "headphones", mute=True)
+    assert outputs.has_uniform_volume
+    assert outputs.volume == 0.6
+
+
+def test_routing_table_reaches_every_output():
+    outputs = create_outputs()
+    for output in outputs:
+        assert outputs.routes[output.address] == output.routes[output.address]
+        assert output.address_mute in outputs.routes
+        for address in output.address_levels:
+            assert address in outputs.routes
+
+    speakers = receive(outputs, "speakers", 0.25)
+    outputs.update(speakers.address_levels[1], 0.5)
+    outputs.update("/1/unknown", 1.0)
+
+    assert speakers.volume == 0.25
+    assert speakers.levels["R"] == 0.5
+    assert [o.volume for o in outputs if o is not speakers] == [None] * 4
+
+
+def test_mute_all_is_a_single_bundle():
+    from pythonosc.osc_bundle import OscBundle
+    outputs = create_outputs()
+    datagrams = []
+
+    class Client():
+        def send(self, datagram):
+            datagrams.append(datagram.dgram)
+
+    outputs.register_client(Client())
+    outputs.mute_all()
+
+    assert len(datagrams) == 1
+    bundle = OscBundle(datagrams[0])
+    messages = [(message.address, message.params[0]) for message in bundle]
+    assert messages[:2] == [("/setBankStart", 1.0), ("/1/busOutput", 1.0)]
+    assert messages[2:] == [(o.address_mute, 1.0) for o in outputs]
+
+
+def test_led_is_only_written_when_the_mute_state_changed():
+    outputs = create_outputs()
+    speakers = receive(outputs, "speakers")
+    writes = []
+    speakers.button.update_led = writes.append
+
+    for mute in (False, False, True, True, True, False):
+        receive(outputs, "speakers", mute=mute)
+
+    assert writes == [False, True, False]
+
+
+def test_presses_toggle_the_reported_state():
+    outputs = create_outputs()
+    speakers = receive(outputs, "speakers")
+    sent = []
+    speakers.send_command = lambda address, value: sent.append(value)
+
+    # Nothing is sent while the mute state is unknown
+    speakers.button.pressed()
+    assert sent == []
+
+    # Presses before TotalMix reported the first one still alternate
+    receive(outputs, "speakers", mute=False)
+    speakers.button.pressed()
+    speakers.button.pressed()
+    assert sent == [1.0, 0.0]
+
+
+def test_button_is_ready_when_pressed():
+    from cineface.hardware import LedButton
+    Device.pin_factory = MockFactory()
+    presses = []
+    button = LedButton(5, 6, lambda: presses.append(True))
+
+    pin = Device.pin_factory.pin(5)
+    pin.drive_low()
+    wait = 0
+    while not presses and wait < 100:
+        time.sleep(0.01)
+        wait += 1
+    button.close()
+
+    assert presses == [True]
@@ -0,0 +1,46 @@
+import toml
+
+from cineface.config import EXAMPLE_CONFIG, Config, load_config
+from cineface.reload import ConfigReloader
+
+
+def write_config(path, **changes):
+    config = toml.loads(EXAMPLE_CONFIG)
+    for section, values in changes.items():
+        if isinstance(values, dict):
+            config[section].update(values)
+        else:
+            config[section] = values
+    path.write_text(toml.dumps(config))
+
+
+def test_empty_outputs_and_non_positive_rates_are_rejected(tmp_path):
+    path = tmp_path / "cineface.toml"
+    write_config(path)
+    assert load_config(str(path)) is not None
+
+    write_config(path, Output=[])
+    assert load_config(str(path)) is None
+
+    write_config(path, LevelDisplay={"max_fps": 0})
+    assert load_config(str(path)) is None
+
+    write_config(path, VolumeDisplay={"cache_size": -1})
+    assert load_config(str(path)) is None
+
+
+def test_failing_reload_keeps_the_running_config(tmp_path):
+    path = tmp_path / "cineface.toml"
+    write_config(path)
+    config = Config(toml.loads(EXAMPLE_CONFIG))
+    reloader = ConfigReloader(str(path), config, None, None, None)
+
+    def fail(config):
+        raise RuntimeError("broken")
+
+    reloader.apply = fail
+    write_config(path, Client={"port": 7002})
+    reloader.mtime = None
+
+    assert reloader.check() is False
+    assert reloader.config is config
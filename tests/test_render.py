@@ -0,0 +1,73 @@
+import threading
+import time
+
+from cineface.render import RenderWorker
+
+
+def wait_until(condition, timeout=2.0):
+    """
+    Wait for condition() to become true, fail after timeout seconds
+    """
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+class SlowDisplay():
+    def __init__(self):
+        self.release = threading.Event()
+        self.rendered = []
+
+    def render(self, snapshot):
+        self.release.wait()
+        self.rendered.append(snapshot)
+
+
+def test_only_newest_snapshot_is_kept():
+    display = SlowDisplay()
+    worker = RenderWorker(display).start()
+
+    # The first frame blocks the worker, the others queue up behind it
+    worker.submit(1)
+    wait_until(lambda: worker.pending is None)
+    for snapshot in (2, 3, 4):
+        worker.submit(snapshot)
+    display.release.set()
+    wait_until(lambda: worker.frames_rendered >= 2)
+    worker.stop()
+
+    assert display.rendered == [1, 4]
+    assert worker.frames_dropped == 2
+
+
+class RecordingDisplay():
+    def __init__(self):
+        self.rendered = []
+        self.scale = 1
+
+    def render(self, snapshot):
+        self.rendered.append(snapshot * self.scale)
+
+
+def test_call_runs_between_frames_and_renders_again():
+    display = RecordingDisplay()
+    worker = RenderWorker(display).start()
+    worker.submit(2)
+    wait_until(lambda: worker.frames_rendered >= 1)
+
+    worker.call(lambda: setattr(display, "scale", 10))
+    wait_until(lambda: worker.frames_rendered >= 2)
+    worker.stop()
+
+    assert display.rendered == [2, 20]
+
+
+def test_stats_include_the_display_and_its_device():
+    display = SlowDisplay()
+    worker = RenderWorker(display)
+    assert worker.stats() == "0 snapshots rendered, 0 dropped"
+
+    display.stats = lambda: "3 frames rendered, 2 skipped"
+    display.device = type("Device", (), {"bytes_sent": 1200, "last_frame_bytes": 40})()
+    assert worker.stats() == "0 snapshots rendered, 0 dropped, 3 frames rendered, 2 skipped, 1200 bytes sent, 40 in the last frame"
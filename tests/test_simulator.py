@@ -0,0 +1,36 @@
+import asyncio
+
+from pythonosc.osc_server import AsyncIOOSCUDPServer
+
+from cineface.osc import RoutingDispatcher, register_ping
+from cineface.simulator import TotalMixSimulator
+
+
+async def wait_for_round_trip(simulator):
+    while not simulator.round_trips:
+        await asyncio.sleep(0.001)
+
+
+def test_ping_is_answered_to_its_source():
+    async def scenario():
+        # cineface's side: the server answers pings through its own socket
+        dispatcher = RoutingDispatcher()
+        server = AsyncIOOSCUDPServer(("127.0.0.1", 0), dispatcher, asyncio.get_running_loop())
+        transport, protocol = await server.create_serve_endpoint()
+        register_ping(dispatcher, transport)
+        port = transport.get_extra_info("sockname")[1]
+
+        simulator = TotalMixSimulator("127.0.0.1", port, channels=1)
+        await simulator.serve("127.0.0.1", 0)
+        try:
+            simulator.send_ping()
+            await asyncio.wait_for(wait_for_round_trip(simulator), 2.0)
+        finally:
+            simulator.transport.close()
+            transport.close()
+        return simulator
+
+    simulator = asyncio.run(scenario())
+    assert len(simulator.round_trips) == 1
+    assert 0.0 < simulator.round_trips[0] < 2.0
+    assert simulator.pings == {}
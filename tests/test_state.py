@@ -0,0 +1,50 @@
+from cineface.state import MixerState, StereoLevels
+
+
+def test_unknown_values_are_none():
+    state = MixerState()
+    channel = state.add_channel()
+
+    assert state.get_volume(channel) is None
+    assert state.get_mute(channel) is None
+    assert state.get_level(channel, "R") is None
+
+
+def test_stereo_levels_view():
+    state = MixerState()
+    state.add_channel()
+    levels = StereoLevels(state, state.add_channel())
+    levels["L"] = 0.25
+    levels["R"] = 0.5
+
+    assert dict(levels) == {"L": 0.25, "R": 0.5}
+    assert state.level_r[1] == 0.5
+
+
+def test_audible_volumes_skip_muted_and_unknown():
+    state = MixerState()
+    for volume, mute in [(0.5, False), (0.7, True), (None, False), (0.6, None)]:
+        channel = state.add_channel()
+        state.set_volume(channel, volume)
+        state.set_mute(channel, mute)
+
+    assert state.audible_volumes(range(len(state))) == [0.5, 0.6]
+
+
+def test_changes_are_published_only_once():
+    state = MixerState()
+    state.add_channel()
+    channel = state.add_channel()
+    events = []
+    state.subscribe("mute", lambda c, mute: events.append(("mute", c, mute)), channel)
+    state.subscribe("level", lambda c, level: events.append(("level", c, level)))
+
+    for _ in range(3):
+        state.set_mute(channel, True)
+        state.set_mute(0, True)
+        state.set_level(channel, "R", 0.5)
+    assert not state.set_level(channel, "R", 0.5)
+    assert state.set_level(channel, "R", None)
+    assert not state.set_level(channel, "R", None)
+
+    assert events == [("mute", 1, True), ("level", 1, 0.5), ("level", 1, None)]
@@ -0,0 +1,56 @@
+import asyncio
+
+from cineface.helpers import nothing
+from cineface.watchdog import Watchdog
+
+
+class FakeOutputs():
+    def __init__(self):
+        self.selections = 0
+        self.stale = False
+        self.on_resync = nothing
+
+    def select_bank(self):
+        self.selections += 1
+
+    def mark_stale(self):
+        self.stale = True
+
+    def dump(self):
+        self.stale = False
+        self.on_resync()
+
+
+def test_silence_marks_stale_and_answer_resyncs():
+    outputs = FakeOutputs()
+    watchdog = Watchdog(outputs, timeout=0.01, min_backoff=0.01, max_backoff=0.02)
+
+    async def scenario():
+        task = asyncio.ensure_future(watchdog.run())
+        while not watchdog.lost:
+            await asyncio.sleep(0.005)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert outputs.stale
+    assert outputs.selections >= 2
+
+    # TotalMix answers: the bus is selected again and the dump completes it
+    selections = outputs.selections
+    watchdog.feed()
+    assert outputs.selections == selections + 1
+    outputs.dump()
+
+    assert not watchdog.lost
+    assert watchdog.probes == 0
+    assert len(watchdog.resync_times) == 1
+
+
+def test_answered_probe_is_not_stale():
+    outputs = FakeOutputs()
+    watchdog = Watchdog(outputs)
+    watchdog.probe()
+    watchdog.feed()
+
+    assert not outputs.stale
+    assert watchdog.backoff == watchdog.min_backoff